@@ -0,0 +1,25 @@
+"""add_users_keyset_indexes
+
+Revision ID: 3b7d9f2e6a15
+Revises: 8e2f4b6a1c93
+Create Date: 2026-10-18 11:20:00.000000
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3b7d9f2e6a15"
+down_revision = "8e2f4b6a1c93"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_users_username_id", "users", ["username", "id"], unique=False)
+    op.create_index("ix_users_email_id", "users", ["email", "id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_users_email_id", table_name="users")
+    op.drop_index("ix_users_username_id", table_name="users")
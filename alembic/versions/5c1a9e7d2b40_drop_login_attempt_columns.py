@@ -0,0 +1,41 @@
+"""drop_login_attempt_columns
+
+Revision ID: 5c1a9e7d2b40
+Revises: d78992b7f40b
+Create Date: 2026-10-18 09:30:00.000000
+
+"""
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5c1a9e7d2b40"
+down_revision = "d78992b7f40b"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Accounts locked by failed logins are released, lockouts now live in the
+    # cache. Accounts blocked by an admin have no block_time and stay blocked.
+    op.execute("UPDATE users SET blocked = false WHERE block_time IS NOT NULL")
+    op.drop_column("users", "block_time")
+    op.drop_column("users", "last_login_attempt")
+    op.drop_column("users", "login_attempts")
+
+
+def downgrade() -> None:
+    op.add_column(
+        "users",
+        sa.Column("login_attempts", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.add_column(
+        "users",
+        sa.Column("last_login_attempt", sa.TIMESTAMP(timezone=True), nullable=True),
+    )
+    op.add_column(
+        "users",
+        sa.Column("block_time", sa.TIMESTAMP(timezone=True), nullable=True),
+    )
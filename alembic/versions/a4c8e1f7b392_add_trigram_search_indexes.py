@@ -0,0 +1,40 @@
+"""add_trigram_search_indexes
+
+Revision ID: a4c8e1f7b392
+Revises: 3b7d9f2e6a15
+Create Date: 2026-10-18 12:05:00.000000
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "a4c8e1f7b392"
+down_revision = "3b7d9f2e6a15"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_users_username_trgm", "users", "username"),
+    ("ix_users_email_trgm", "users", "email"),
+    ("ix_roles_name_trgm", "roles", "name"),
+    ("ix_permissions_name_trgm", "permissions", "name"),
+]
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for name, table, column in INDEXES:
+        op.create_index(
+            name,
+            table,
+            [column],
+            unique=False,
+            postgresql_using="gin",
+            postgresql_ops={column: "gin_trgm_ops"},
+        )
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,23 @@
+"""add_users_created_at_index
+
+Revision ID: c61f0d3a8e27
+Revises: a4c8e1f7b392
+Create Date: 2026-10-18 12:40:00.000000
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c61f0d3a8e27"
+down_revision = "a4c8e1f7b392"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_users_created_at", "users", ["created_at"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_users_created_at", table_name="users")
@@ -0,0 +1,54 @@
+"""add_association_keys
+
+Revision ID: e5a92c4d7f18
+Revises: c61f0d3a8e27
+Create Date: 2026-10-18 13:10:00.000000
+
+"""
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "e5a92c4d7f18"
+down_revision = "c61f0d3a8e27"
+branch_labels = None
+depends_on = None
+
+# table, primary key columns, reverse index
+TABLES = [
+    (
+        "user_role",
+        ["user_id", "role_id"],
+        "ix_user_role_role_id_user_id",
+    ),
+    (
+        "role_permission",
+        ["role_id", "permission_id"],
+        "ix_role_permission_permission_id_role_id",
+    ),
+]
+
+
+def upgrade() -> None:
+    for table, columns, index in TABLES:
+        first, second = columns
+        # Rows with a NULL side grant nothing and cannot be part of the key.
+        op.execute(f"DELETE FROM {table} WHERE {first} IS NULL OR {second} IS NULL")
+        # Keep one row of each duplicated grant.
+        op.execute(
+            f"DELETE FROM {table} a USING {table} b "
+            f"WHERE a.ctid > b.ctid "
+            f"AND a.{first} = b.{first} AND a.{second} = b.{second}"
+        )
+        op.create_primary_key(f"{table}_pkey", table, columns)
+        op.create_index(index, table, [second, first], unique=False)
+
+
+def downgrade() -> None:
+    for table, columns, index in reversed(TABLES):
+        op.drop_index(index, table_name=table)
+        op.drop_constraint(f"{table}_pkey", table, type_="primary")
+        for column in columns:
+            op.alter_column(table, column, existing_type=sa.Integer(), nullable=True)
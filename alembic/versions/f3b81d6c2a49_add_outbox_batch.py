@@ -0,0 +1,29 @@
+"""add_outbox_batch
+
+Revision ID: f3b81d6c2a49
+Revises: e5a92c4d7f18
+Create Date: 2026-10-18 14:20:00.000000
+
+"""
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "f3b81d6c2a49"
+down_revision = "e5a92c4d7f18"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("outbox", sa.Column("batch", sa.String(length=32), nullable=True))
+    op.create_index(
+        "ix_outbox_batch_status", "outbox", ["batch", "status"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_outbox_batch_status", table_name="outbox")
+    op.drop_column("outbox", "batch")
@@ -9,8 +9,10 @@ from flask_login import LoginManager, current_user
 from flask_mail import Mail
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 from .config import settings
+from .utils.json_provider import OrjsonProvider
 
 dictConfig(
     {
@@ -35,6 +37,14 @@ dictConfig(
 # Flask
 app = Flask(__name__)
 app.config.from_object(settings)
+app.json = OrjsonProvider(app)
+if settings.TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(  # type: ignore
+        app.wsgi_app,
+        x_for=settings.TRUSTED_PROXIES,
+        x_proto=settings.TRUSTED_PROXIES,
+        x_host=settings.TRUSTED_PROXIES,
+    )
 
 # Database
 db = SQLAlchemy(app)
@@ -76,6 +86,32 @@ def get_timezone():
 babel = Babel(app, locale_selector=get_locale, timezone_selector=get_timezone)
 
 
+# Dark theme
+@app.route("/set_theme/<string:theme>", methods=["POST"])
+def set_theme(theme: str) -> Any:
+    session["theme"] = theme
+    return jsonify({"theme": theme})
+
+
+def get_theme() -> str:
+    theme = session.get("theme", "auto")
+    return theme
+
+
+def get_theme_icon() -> str:
+    theme = session.get("theme", "auto")
+    icon = "#circle-half"
+    if theme == "dark":
+        icon = "#moon-stars-fill"
+    elif theme == "light":
+        icon = "#sun-fill"
+    return icon
+
+
+app.jinja_env.globals.update(get_theme=get_theme)
+app.jinja_env.globals.update(get_theme_icon=get_theme_icon)
+
+
 # Blueprints
 from .views.home import home  # type: ignore  # noqa
 
@@ -101,6 +137,9 @@ from .views.user import user  # type: ignore  # noqa
 
 app.register_blueprint(user.user_bp)  # type: ignore  # noqa
 
+# Commands
+from . import commands  # type: ignore  # noqa
+
 
 @app.errorhandler(404)
 def page_not_found(e):
@@ -110,29 +149,3 @@ def page_not_found(e):
 @app.errorhandler(500)
 def internal_server_error(e):
     return render_template("errors/500.html"), 500
-
-
-# Dark theme
-@app.route("/set_theme/<string:theme>", methods=["POST"])
-def set_theme(theme: str) -> Any:
-    session["theme"] = theme
-    return jsonify({"theme": theme})
-
-
-def get_theme() -> str:
-    theme = session.get("theme", "auto")
-    return theme
-
-
-def get_theme_icon() -> str:
-    theme = session.get("theme", "auto")
-    icon = "#circle-half"
-    if theme == "dark":
-        icon = "#moon-stars-fill"
-    elif theme == "light":
-        icon = "#sun-fill"
-    return icon
-
-
-app.jinja_env.globals.update(get_theme=get_theme)
-app.jinja_env.globals.update(get_theme_icon=get_theme_icon)
@@ -0,0 +1,56 @@
+from typing import FrozenSet, Iterable, Optional, Tuple
+
+from flask import g, has_app_context
+
+
+class Grants:
+    """Effective roles and role permissions of a user, compiled to sets."""
+
+    __slots__ = ("roles", "role_permissions")
+
+    def __init__(
+        self, roles: FrozenSet[str], role_permissions: FrozenSet[Tuple[str, str]]
+    ) -> None:
+        self.roles = roles
+        self.role_permissions = role_permissions
+
+    def __repr__(self) -> str:
+        return f"Grants(roles={sorted(self.roles)}, role_permissions={sorted(self.role_permissions)})"  # noqa: E501
+
+    def has_role(self, role_name: str) -> bool:
+        return role_name in self.roles
+
+    def has_role_permission(self, role_name: str, permission_name: str) -> bool:
+        return (role_name, permission_name) in self.role_permissions
+
+    @staticmethod
+    def compile(roles: Iterable) -> "Grants":
+        roles = list(roles)
+        return Grants(
+            frozenset(role.name for role in roles),
+            frozenset(
+                (role.name, permission.name)
+                for role in roles
+                for permission in role.permissions
+            ),
+        )
+
+
+def get_grants(user) -> Grants:
+    """Compile the grants of a ``User`` once per request."""
+    if not has_app_context():
+        return Grants.compile(user.roles)
+    compiled = g.setdefault("grants", {})
+    if user.id not in compiled:
+        compiled[user.id] = Grants.compile(user.roles_with_permissions())
+    return compiled[user.id]
+
+
+def forget_grants(user_id: Optional[int] = None) -> None:
+    """Drop compiled grants of one user, or of every user if ``None``."""
+    if not has_app_context():
+        return
+    if user_id is None:
+        g.pop("grants", None)
+    else:
+        g.setdefault("grants", {}).pop(user_id, None)
@@ -0,0 +1,76 @@
+import logging
+import time
+
+import click
+from sqlalchemy.exc import OperationalError, ProgrammingError, SQLAlchemyError
+
+from app import app, db
+from app.config import settings
+from app.models import User
+from app.utils.email import deliver_outbox
+from app.utils.passwords import measure
+
+logger = logging.getLogger(__name__)
+
+
+@app.cli.command("sync-admins")
+def sync_admins() -> None:
+    """Grant the admin role to the users listed in ADMIN_EMAIL."""
+    count = User.sync_admin_roles()
+    click.echo(f"Admin role granted to {count} user(s)")
+
+
+@app.cli.command("bcrypt-calibrate")
+@click.option("--target-ms", default=250, help="Latency budget for one hash.")
+@click.option("--min-rounds", default=10)
+@click.option("--max-rounds", default=16)
+def bcrypt_calibrate(target_ms: int, min_rounds: int, max_rounds: int) -> None:
+    """Pick the highest bcrypt cost that hashes within the latency budget."""
+    best = min_rounds
+    for rounds in range(min_rounds, max_rounds + 1):
+        elapsed = measure(rounds)
+        click.echo(f"rounds={rounds}: {elapsed:.0f}ms")
+        if elapsed > target_ms:
+            break
+        best = rounds
+    click.echo(f"BCRYPT_LOG_ROUNDS={best}")
+
+
+@app.cli.command("mail-worker")
+@click.option("--batch-size", default=settings.MAIL_MAX_PER_CONNECTION)
+@click.option("--poll-interval", default=5, help="Seconds to wait when idle.")
+@click.option("--once", is_flag=True, help="Deliver one batch and exit.")
+def mail_worker(batch_size: int, poll_interval: int, once: bool) -> None:
+    """Send the messages queued in the outbox."""
+    while True:
+        try:
+            claimed = deliver_outbox(batch_size)
+        except SQLAlchemyError:
+            db.session.rollback()
+            logger.exception("Outbox delivery failed")
+            claimed = 0
+        if once:
+            break
+        if claimed < batch_size:
+            time.sleep(poll_interval)
+
+
+def sync_admins_on_startup() -> None:
+    """Run the admin sync once, from the gunicorn master before it forks."""
+    with app.app_context():
+        try:
+            count = User.sync_admin_roles()
+        except (OperationalError, ProgrammingError):
+            db.session.rollback()
+            logger.warning("Admin role sync skipped, database not ready")
+            return
+        except SQLAlchemyError:
+            db.session.rollback()
+            logger.exception("Admin role sync failed")
+            return
+        finally:
+            # Workers must not inherit the master's connections.
+            db.session.remove()
+            db.engine.dispose()
+        if count:
+            logger.info("Admin role granted to %d user(s)", count)
@@ -7,9 +7,15 @@ from pydantic import BaseSettings, PostgresDsn, validator
 class Settings(BaseSettings):
     # Flask
     SECRET_KEY: str
+    # gunicorn workers per host, read by gunicorn from the same variable
+    WEB_CONCURRENCY: int = 1
+    # reverse proxies in front of the app whose X-Forwarded-* headers are
+    # trusted; without them every client behind a proxy shares one address
+    TRUSTED_PROXIES: int = 0
 
     # Site
-    ADMIN_EMAIL: str
+    ADMIN_EMAIL: list
+    ADMIN_SYNC_ON_STARTUP: bool = True
     SITE_NAME: str
     MAX_LOGIN_ATTEMPTS: int = 5
     LOCK_TIME: timedelta = timedelta(minutes=5)
@@ -17,6 +23,26 @@ class Settings(BaseSettings):
     DEFAULT_LANGUAGE: str = "en"
     LANGUAGES: list = ["en", "es"]
     ROWS_PER_PAGE: int = 10
+    DATATABLES_MAX_LENGTH: int = 100
+    COUNT_ESTIMATE_THRESHOLD: int = 100000
+    EXPORT_BATCH_SIZE: int = 1000
+    LAST_SEEN_GRANULARITY: timedelta = timedelta(seconds=60)
+    LAST_SEEN_FLUSH_INTERVAL: timedelta = timedelta(seconds=30)
+    LAST_SEEN_FLUSH_SIZE: int = 100
+
+    # Rate limits, requests per window
+    RATE_LIMIT_WINDOW: timedelta = timedelta(minutes=1)
+    RATE_LIMIT_PER_IDENTIFIER: int = 5
+    RATE_LIMIT_LOGIN: int = 10
+    RATE_LIMIT_REGISTER: int = 5
+    RATE_LIMIT_RESET_PASSWORD: int = 5
+    RATE_LIMIT_CONFIRM: int = 10
+
+    # Passwords; the pool and queue are shared out among the web workers
+    BCRYPT_LOG_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: Optional[int] = None  # per web worker
+    PASSWORD_HASH_QUEUE_SIZE: int = 32  # per host
+    PASSWORD_HASH_TIMEOUT: int = 10
 
     # Email
     MAIL_SERVER: str
@@ -24,10 +50,22 @@ class Settings(BaseSettings):
     MAIL_USE_TLS: str
     MAIL_USERNAME: str
     MAIL_PASSWORD: str
+    MAIL_DEFAULT_SENDER: str = "noreplay@test.com"
+    MAIL_SENDERS: int = 2
+    MAIL_QUEUE_SIZE: int = 1000
+    MAIL_MAX_PER_CONNECTION: int = 50
+    MAIL_IDLE_TIMEOUT: int = 30
+    MAIL_MAX_RETRIES: int = 3
+    MAIL_USE_OUTBOX: bool = True
+    MAIL_RETRY_BACKOFF: timedelta = timedelta(seconds=30)
 
     # Cache
-    CACHE_TYPE: str = "SimpleCache"
+    CACHE_TYPE: str = "app.utils.sqlite_cache.SQLiteCache"
     CACHE_DEFAULT_TIMEOUT: int = 300
+    CACHE_THRESHOLD: int = 10000
+    CACHE_SQLITE_PATH: Optional[str] = None  # defaults to the instance folder
+    COUNT_CACHE_TIMEOUT: int = 60 * 60
+    USER_CACHE_TIMEOUT: int = 6 * 60 * 60
 
     # Database
     POSTGRES_HOSTNAME: str
@@ -1,7 +1,21 @@
+import hashlib
+from datetime import timedelta
 from functools import wraps
+from typing import Iterable, Optional
 
-from flask import abort
+from flask import abort, make_response, request, session
+from flask_babel import get_locale
 from flask_login import current_user
+from werkzeug.exceptions import TooManyRequests
+
+from app import get_theme
+from app.config import settings
+from app.utils import rate_limit as limiter
+from app.utils.versions import get_versions
+
+# Query parameters that change on every request without changing the
+# response: the DataTables draw counter and jQuery's cache buster.
+ETAG_IGNORED_ARGS = ("draw", "_")
 
 
 def role_required(role_name):
@@ -40,3 +54,91 @@ def role_permission_required(role_name, permission_name):
 
 def moderate_permission_required(permission_name):
     return role_permission_required("moderate", permission_name)
+
+
+def rate_limit(
+    scope: str,
+    limit: int,
+    identifier: Optional[str] = None,
+    identifier_limit: int = settings.RATE_LIMIT_PER_IDENTIFIER,
+    window: timedelta = settings.RATE_LIMIT_WINDOW,
+    methods: Iterable[str] = ("POST",),
+):
+    """Throttle a view per client IP and, if ``identifier`` names a form
+    field, per value of that field (e.g. the email being logged in).
+
+    Behind a reverse proxy the client IP is only known when
+    ``TRUSTED_PROXIES`` is set.
+    """
+    seconds = int(window.total_seconds())
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method in methods:
+                checks = [(f"{scope}:ip:{request.remote_addr}", limit)]
+                value = request.form.get(identifier) if identifier else None
+                if value:
+                    checks.append((f"{scope}:id:{value.lower()}", identifier_limit))
+                for key, key_limit in checks:
+                    retry_after = limiter.hit(key, key_limit, seconds)
+                    if retry_after is not None:
+                        raise TooManyRequests(retry_after=retry_after)
+            return f(*args, **kwargs)
+
+        return decorated_function
+
+    return decorator
+
+
+def etag(*tables: str):
+    """Answer conditional GETs from the change versions of ``tables``.
+
+    The tag covers the table versions, the current user's version and
+    grants, the locale, the theme, the view arguments and the normalized
+    query string, so a matching ``If-None-Match`` gets a 304 before the view
+    runs. Pages with pending flashed messages are always rendered and never
+    tagged.
+
+    The DataTables pages request their data with ``cache: true``, which
+    keeps the URLs stable so the browser can revalidate them.
+    """
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method != "GET" or "_flashes" in session:
+                return f(*args, **kwargs)
+            names = [f"table:{table}" for table in tables]
+            if current_user.is_authenticated:
+                names += ["rbac", f"user:{current_user.id}"]
+            params = sorted(
+                (key, value)
+                for key, value in request.args.items(multi=True)
+                if key not in ETAG_IGNORED_ARGS
+            )
+            key = repr(
+                (
+                    request.endpoint,
+                    sorted(kwargs.items()),
+                    params,
+                    get_versions(*names),
+                    str(get_locale()),
+                    get_theme(),
+                )
+            )
+            tag = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+            if request.if_none_match.contains(tag):
+                response = make_response("", 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(tag)
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+
+        return decorated_function
+
+    return decorator
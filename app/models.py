@@ -1,23 +1,45 @@
 from datetime import datetime, timedelta, timezone
-from typing import List, Optional, Union
+from typing import Dict, Iterator, List, Optional, Union
 
 import jwt
 from flask import redirect, request, url_for
 from flask.typing import ResponseValue
 from flask_babel import format_datetime
 from flask_login import UserMixin, current_user
-from sqlalchemy import BOOLEAN, Column, ForeignKey, Integer, String, Table
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from flask_mail import Message
+from sqlalchemy import (
+    BOOLEAN,
+    JSON,
+    Column,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Table,
+    Text,
+    delete,
+    func,
+    literal,
+    select,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Mapped, mapped_column, relationship, selectinload
+from sqlalchemy.sql import ColumnElement, Select
 from sqlalchemy.sql.expression import text
 from sqlalchemy.sql.sqltypes import TIMESTAMP
 
-from app import bcrypt, cache, db, login_manager
+from app import cache, db, login_manager
+from app.authz import Grants, forget_grants, get_grants
 from app.config import settings
+from app.utils import lockout
+from app.utils.passwords import needs_rehash, password_hasher
+from app.utils.presence import last_seen_writer
+from app.utils.versions import bump_version, get_versions
 
 
 @login_manager.user_loader
-def load_user(user_id) -> Optional["User"]:
-    return User.query.get(user_id)
+def load_user(user_id) -> Optional["UserSnapshot"]:
+    return UserSnapshot.load(int(user_id))
 
 
 @login_manager.unauthorized_handler
@@ -27,19 +49,29 @@ def unauthorized() -> ResponseValue:
 
 class User(db.Model, UserMixin):  # type: ignore  # noqa
     __tablename__ = "users"
+    __table_args__ = (
+        Index("ix_users_username_id", "username", "id"),
+        Index("ix_users_email_id", "email", "id"),
+        Index("ix_users_created_at", "created_at"),
+        Index(
+            "ix_users_username_trgm",
+            "username",
+            postgresql_using="gin",
+            postgresql_ops={"username": "gin_trgm_ops"},
+        ),
+        Index(
+            "ix_users_email_trgm",
+            "email",
+            postgresql_using="gin",
+            postgresql_ops={"email": "gin_trgm_ops"},
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     username: Mapped[str] = mapped_column(String(40), unique=True, nullable=False)
     email: Mapped[str] = mapped_column(String(120), unique=True, nullable=False)
     password: Mapped[str] = mapped_column(String(60), nullable=False)
     blocked: Mapped[bool] = mapped_column(BOOLEAN, default=False, nullable=False)
-    login_attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
-    last_login_attempt: Mapped[datetime] = mapped_column(
-        TIMESTAMP(timezone=True), nullable=True
-    )
-    block_time: Mapped[datetime] = mapped_column(
-        TIMESTAMP(timezone=True), nullable=True
-    )
     created_at: Mapped[datetime] = mapped_column(
         TIMESTAMP(timezone=True),
         server_default=text("CURRENT_TIMESTAMP"),
@@ -65,8 +97,7 @@ class User(db.Model, UserMixin):  # type: ignore  # noqa
         return f"User(id={self.id}, username={self.username}, email={self.email}, blocked={self.blocked}, created_at={self.created_at})"  # noqa: E501
 
     def ping(self) -> None:
-        self.last_seen = datetime.utcnow()
-        self.update()
+        last_seen_writer.touch(self.id, self.last_seen)
 
     def get_token(self, expires_sec: int = 300) -> str:
         encoded = jwt.encode(
@@ -114,14 +145,20 @@ class User(db.Model, UserMixin):  # type: ignore  # noqa
     def save(self) -> None:
         db.session.add(self)
         db.session.commit()
+        bump_version(f"table:{self.__tablename__}")
 
     def update(self) -> None:
         self.updated_at = datetime.utcnow()
         db.session.commit()
+        forget_grants(self.id)
+        bump_version(f"user:{self.id}")
+        bump_version(f"table:{self.__tablename__}")
 
     def delete(self) -> None:
         db.session.delete(self)
         db.session.commit()
+        bump_version(f"table:{self.__tablename__}")
+        bump_version(f"user:{self.id}")
 
     def block_account(self) -> None:
         self.blocked = True
@@ -132,40 +169,66 @@ class User(db.Model, UserMixin):  # type: ignore  # noqa
         self.update()
 
     def add_role(self, role: "Role") -> None:
-        self.roles.append(role)
+        if role not in self.roles:
+            self.roles.append(role)
         self.update()
-        cache.delete_memoized(self.has_role)
-        cache.delete_memoized(self.has_role_permission)
 
     def remove_role(self, role: "Role") -> None:
         self.roles.remove(role)
         self.update()
-        cache.delete_memoized(self.has_role)
-        cache.delete_memoized(self.has_role_permission)
 
-    @cache.memoize(300)
+    @property
+    def grants(self) -> Grants:
+        return get_grants(self)
+
+    def roles_with_permissions(self) -> List["Role"]:
+        """Load the roles of the user and their permissions in two queries."""
+        return (
+            db.session.execute(
+                select(Role)
+                .join(user_role, user_role.c.role_id == Role.id)
+                .where(user_role.c.user_id == self.id)
+                .options(selectinload(Role.permissions))
+            )
+            .scalars()
+            .all()
+        )
+
     def has_role(self, role_name: str) -> bool:
-        for role in self.roles:
-            if role.name == role_name:
-                return True
-        return False
+        return self.grants.has_role(role_name)
 
-    @cache.memoize(300)
     def has_role_permission(self, role_name: str, permission_name: str) -> bool:
-        for role in self.roles:
-            if role.name == role_name:
-                for permission in role.permissions:
-                    if permission.name == permission_name:
-                        return True
-        return False
+        return self.grants.has_role_permission(role_name, permission_name)
 
     def is_admin(self):
         return self.has_role("admin")
 
-    def set_admin_role(self) -> None:
-        role_admin = Role.query.get_or_404(1)
-        self.add_role(role_admin)
-        self.update()
+    @staticmethod
+    def sync_admin_roles() -> int:
+        role_admin = Role.query.filter_by(name="admin").first()
+        if role_admin is None:
+            return 0
+        users = (
+            User.query.filter(
+                User.email.in_(settings.ADMIN_EMAIL),
+                ~User.roles.any(Role.id == role_admin.id),
+            )
+            .options(selectinload(User.roles))
+            .all()
+        )
+        if not users:
+            return 0
+        for user in users:
+            user.roles.append(role_admin)
+            user.updated_at = datetime.utcnow()
+        # Read the ids before the commit expires the users.
+        user_ids = [user.id for user in users]
+        db.session.commit()
+        for user_id in user_ids:
+            forget_grants(user_id)
+            bump_version(f"user:{user_id}")
+        bump_version(f"table:{User.__tablename__}")
+        return len(users)
 
     def update_locale(self, locale: str) -> bool:
         if locale in settings.LANGUAGES:
@@ -184,60 +247,164 @@ class User(db.Model, UserMixin):  # type: ignore  # noqa
         return User.query.get(user_id)
 
     def check_password_hash(self, password: str) -> bool:
-        return bcrypt.check_password_hash(self.password, password)
+        if not password_hasher.check(self.password, password):
+            return False
+        if needs_rehash(self.password):
+            self.password = User.generate_password_hash(password)
+        return True
 
     @staticmethod
     def generate_password_hash(password: str) -> str:
-        return bcrypt.generate_password_hash(password).decode("utf-8")
+        return password_hasher.hash(password, settings.BCRYPT_LOG_ROUNDS)
 
     def handle_failed_login(self):
-        self.login_attempts += 1
-        self.last_login_attempt = datetime.utcnow()
-        if self.login_attempts >= settings.MAX_LOGIN_ATTEMPTS:
-            self.blocked = True
-            self.block_time = datetime.utcnow()
-        self.update()
+        lockout.record_failure(self.id)
 
     def handle_successful_login(self):
-        self.login_attempts = 0
-        self.last_login_attempt = None
-        self.blocked = False
-        self.block_time = None
-        self.update()
+        lockout.clear(self.id)
+        if db.session.is_modified(self):
+            self.update()
 
     def is_blocked(self):
-        if self.blocked:
-            if self.block_time is None:
-                return True
-            elif datetime.now(timezone.utc) >= self.block_time + settings.BLOCK_TIME:
-                self.blocked = False
-                self.block_time = None
-                self.login_attempts = 0
-                self.update()
-                return False
-            else:
-                return True
-        else:
-            return False
+        return self.blocked or lockout.is_locked(self.id)
+
+
+class UserSnapshot:
+    """Read-only copy of a user, cached for the user loader.
+
+    Attributes not held by the snapshot are read from the ``User`` row,
+    which is only loaded on first access.
+    """
+
+    _fields = (
+        "id",
+        "username",
+        "email",
+        "confirmed",
+        "blocked",
+        "locale",
+        "timezone",
+        "last_seen",
+        "grants",
+    )
+    __slots__ = _fields + ("_user",)
+
+    id: int
+    username: str
+    email: str
+    confirmed: bool
+    blocked: bool
+    locale: str
+    timezone: Optional[str]
+    last_seen: Optional[datetime]
+    grants: Grants
+
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
+    def __init__(self, user: Optional[User] = None, **values) -> None:
+        for name in self._fields:
+            object.__setattr__(self, name, values.get(name))
+        object.__setattr__(self, "_user", user)
+
+    def __setattr__(self, name, value) -> None:
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __getattr__(self, name):
+        return getattr(self.user, name)
+
+    def __getstate__(self) -> dict:
+        return {name: getattr(self, name) for name in self._fields}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(**state)
+
+    def __eq__(self, other) -> bool:
+        if hasattr(other, "get_id"):
+            return self.get_id() == other.get_id()
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"UserSnapshot(id={self.id}, username={self.username}, email={self.email}, blocked={self.blocked})"  # noqa: E501
+
+    @property
+    def user(self) -> User:
+        if self._user is None:
+            object.__setattr__(self, "_user", db.session.get(User, self.id))
+        return self._user
+
+    def get_id(self) -> str:
+        return str(self.id)
+
+    def ping(self) -> None:
+        last_seen_writer.touch(self.id, self.last_seen)
+
+    def has_role(self, role_name: str) -> bool:
+        return self.grants.has_role(role_name)
+
+    def has_role_permission(self, role_name: str, permission_name: str) -> bool:
+        return self.grants.has_role_permission(role_name, permission_name)
+
+    def is_admin(self) -> bool:
+        return self.has_role("admin")
+
+    @staticmethod
+    def from_user(user: User) -> "UserSnapshot":
+        return UserSnapshot(
+            user,
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            confirmed=user.confirmed,
+            blocked=user.blocked,
+            locale=user.locale,
+            timezone=user.timezone,
+            last_seen=user.last_seen,
+            grants=user.grants,
+        )
+
+    @staticmethod
+    def load(user_id: int) -> Optional["UserSnapshot"]:
+        rbac_version, user_version = get_versions("rbac", f"user:{user_id}")
+        key = f"user_snapshot:{user_id}:{rbac_version}:{user_version}"
+        snapshot = cache.get(key)
+        if snapshot is None:
+            user = db.session.get(User, user_id)
+            if user is None:
+                return None
+            snapshot = UserSnapshot.from_user(user)
+            cache.set(key, snapshot, timeout=settings.USER_CACHE_TIMEOUT)
+        return snapshot
 
 
 role_permission = Table(
     "role_permission",
     db.Model.metadata,
-    Column("role_id", Integer, ForeignKey("roles.id")),
-    Column("permission_id", Integer, ForeignKey("permissions.id")),
+    Column("role_id", Integer, ForeignKey("roles.id"), primary_key=True),
+    Column("permission_id", Integer, ForeignKey("permissions.id"), primary_key=True),
+    Index("ix_role_permission_permission_id_role_id", "permission_id", "role_id"),
 )
 
 user_role = Table(
     "user_role",
     db.Model.metadata,
-    Column("user_id", Integer, ForeignKey("users.id")),
-    Column("role_id", Integer, ForeignKey("roles.id")),
+    Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
+    Column("role_id", Integer, ForeignKey("roles.id"), primary_key=True),
+    Index("ix_user_role_role_id_user_id", "role_id", "user_id"),
 )
 
 
 class Role(db.Model):  # type: ignore  # noqa
     __tablename__ = "roles"
+    __table_args__ = (
+        Index(
+            "ix_roles_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     name: Mapped[str] = mapped_column(String(40), unique=True, nullable=False)
@@ -273,15 +440,22 @@ class Role(db.Model):  # type: ignore  # noqa
         self.updated_user = current_user.id
         db.session.add(self)
         db.session.commit()
+        bump_version(f"table:{self.__tablename__}")
 
     def update(self) -> None:
         self.updated_at = datetime.utcnow()
         self.updated_user = current_user.id
         db.session.commit()
+        forget_grants()
+        bump_version("rbac")
+        bump_version(f"table:{self.__tablename__}")
 
     def delete(self) -> None:
         db.session.delete(self)
         db.session.commit()
+        bump_version(f"table:{self.__tablename__}")
+        forget_grants()
+        bump_version("rbac")
 
     def to_dict(self) -> dict:
         return {
@@ -294,16 +468,91 @@ class Role(db.Model):  # type: ignore  # noqa
             "created_at": format_datetime(self.created_at, format="long"),
         }
 
+    @staticmethod
+    def member_counts() -> Dict[int, int]:
+        """Return the number of users of each role, by role id."""
+        stmt = select(user_role.c.role_id, func.count()).group_by(user_role.c.role_id)
+        return dict(db.session.execute(stmt).all())
+
+    def add_members(self, *where: ColumnElement) -> int:
+        """Add the users matching ``where`` to the role with a single
+        ``INSERT ... SELECT``, skipping current members.
+
+        Return the number of users added.
+        """
+        stmt = (
+            insert(user_role)
+            .from_select(
+                ["user_id", "role_id"],
+                select(User.id, literal(self.id, Integer)).where(*where),
+            )
+            .on_conflict_do_nothing()
+        )
+        added = db.session.execute(stmt).rowcount
+        db.session.commit()
+        if added:
+            self._members_changed()
+        return added
+
+    def remove_members(self, *where: ColumnElement) -> int:
+        """Remove the users matching ``where`` from the role with a single
+        ``DELETE``.
+
+        Return the number of users removed.
+        """
+        stmt = delete(user_role).where(
+            user_role.c.role_id == self.id,
+            user_role.c.user_id.in_(select(User.id).where(*where)),
+        )
+        removed = db.session.execute(stmt).rowcount
+        db.session.commit()
+        if removed:
+            self._members_changed()
+        return removed
+
+    def _members_changed(self) -> None:
+        # One invalidation for the whole batch: the rbac version covers the
+        # cached snapshots of every member.
+        forget_grants()
+        bump_version("rbac")
+        bump_version(f"table:{User.__tablename__}")
+
+    def member_emails(self) -> Select:
+        """Return a SELECT of the emails of the role members."""
+        return (
+            select(User.email)
+            .join(user_role, user_role.c.user_id == User.id)
+            .where(user_role.c.role_id == self.id)
+        )
+
+    def iter_member_emails(self, batch_size: int) -> Iterator[List[str]]:
+        """Yield the emails of the role members in lists of ``batch_size``,
+        streamed from a server side cursor on a dedicated connection."""
+        stmt = self.member_emails().order_by(User.id)
+        with db.engine.connect() as connection:
+            result = connection.execution_options(yield_per=batch_size).execute(stmt)
+            for partition in result.partitions():
+                yield [email for (email,) in partition]
+
     @staticmethod
     def insert_default_values() -> None:
         db.session.add(Permission(name="admin", description="Admin role"))
         db.session.add(Permission(name="moderate", description="Moderator role"))
         db.session.add(Permission(name="users", description="Users role"))
         db.session.commit()
+        bump_version(f"table:{Permission.__tablename__}")
 
 
 class Permission(db.Model):  # type: ignore  # noqa
     __tablename__ = "permissions"
+    __table_args__ = (
+        Index(
+            "ix_permissions_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     name: Mapped[str] = mapped_column(String(40), unique=True, nullable=False)
@@ -334,15 +583,22 @@ class Permission(db.Model):  # type: ignore  # noqa
         self.updated_user = current_user.id
         db.session.add(self)
         db.session.commit()
+        bump_version(f"table:{self.__tablename__}")
 
     def update(self) -> None:
         self.updated_at = datetime.utcnow()
         self.updated_user = current_user.id
         db.session.commit()
+        forget_grants()
+        bump_version("rbac")
+        bump_version(f"table:{self.__tablename__}")
 
     def delete(self) -> None:
         db.session.delete(self)
         db.session.commit()
+        bump_version(f"table:{self.__tablename__}")
+        forget_grants()
+        bump_version("rbac")
 
     def to_dict(self) -> dict:
         return {
@@ -365,6 +621,60 @@ class Permission(db.Model):  # type: ignore  # noqa
             Permission(name="delete", description="Delete permission", color="#ff595e")
         )
         db.session.commit()
+        bump_version(f"table:{Permission.__tablename__}")
+
+
+class Outbox(db.Model):  # type: ignore  # noqa
+    __tablename__ = "outbox"
+    __table_args__ = (
+        Index("ix_outbox_status_next_attempt", "status", "next_attempt_at"),
+        Index("ix_outbox_batch_status", "batch", "status"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    subject: Mapped[str] = mapped_column(String(255), nullable=False)
+    sender: Mapped[str] = mapped_column(String(120), nullable=False)
+    recipients: Mapped[list] = mapped_column(JSON, nullable=False)
+    text_body: Mapped[str] = mapped_column(Text, nullable=False, default="")
+    html_body: Mapped[str] = mapped_column(Text, nullable=False, default="")
+    status: Mapped[str] = mapped_column(String(20), nullable=False, default="pending")
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    last_error: Mapped[str] = mapped_column(Text, nullable=True)
+    next_attempt_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP(timezone=True),
+        server_default=text("CURRENT_TIMESTAMP"),
+        nullable=False,
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP(timezone=True),
+        server_default=text("CURRENT_TIMESTAMP"),
+        nullable=False,
+    )
+    sent_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), nullable=True)
+    batch: Mapped[str] = mapped_column(String(32), nullable=True)
+
+    def __repr__(self) -> str:
+        return f"Outbox(id={self.id}, subject={self.subject}, recipients={self.recipients}, status={self.status}, attempts={self.attempts})"  # noqa: E501
+
+    def to_message(self) -> Message:
+        msg = Message(self.subject, sender=self.sender, recipients=self.recipients)
+        msg.body = self.text_body
+        msg.html = self.html_body
+        return msg
+
+    def mark_sent(self) -> None:
+        self.status = "sent"
+        self.sent_at = datetime.now(timezone.utc)
+
+    def mark_failed(self, error: Exception) -> None:
+        self.attempts += 1
+        self.last_error = repr(error)
+        if self.attempts >= settings.MAIL_MAX_RETRIES:
+            self.status = "failed"
+        else:
+            self.next_attempt_at = datetime.now(timezone.utc) + (
+                settings.MAIL_RETRY_BACKOFF * 2 ** (self.attempts - 1)
+            )
 
 
 # @event.listens_for(Role.__table__, 'after_create')
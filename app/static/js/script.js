@@ -24,4 +24,14 @@ function change_language(locale){
             console.log("NOT")
         }
     })
-}
\ No newline at end of file
+}
+
+// Tables leave `draw` out of their requests so replies can be revalidated
+// with ETags, which also disables DataTables' check for out-of-order
+// replies. Abort the previous request before each draw so a late reply
+// never replaces a newer one.
+function abortPreviousDraw(e, settings) {
+    if (settings.jqXHR) {
+        settings.jqXHR.abort();
+    }
+}
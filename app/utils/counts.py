@@ -0,0 +1,57 @@
+from typing import Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.sql import ColumnElement, Select
+
+from app import cache, db
+from app.config import settings
+from app.utils.versions import get_version
+
+
+def total(model) -> int:
+    """Return the exact number of rows of ``model``.
+
+    The count is cached under the ``table:<name>`` version, which the model
+    bumps when rows are saved or deleted.
+    """
+    name = model.__tablename__
+    key = f"count:{name}:{get_version(f'table:{name}')}"
+    value = cache.get(key)
+    if value is None:
+        value = db.session.execute(select(func.count()).select_from(model)).scalar_one()
+        cache.set(key, value, timeout=settings.COUNT_CACHE_TIMEOUT)
+    return value
+
+
+def estimate(stmt: Select) -> Optional[int]:
+    """Return the planner's row estimate for ``stmt``, or ``None`` if the
+    database cannot provide one."""
+    connection = db.session.connection()
+    if connection.dialect.name != "postgresql":
+        return None
+    compiled = stmt.compile(dialect=connection.dialect)
+    (plan,) = connection.exec_driver_sql(
+        f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params
+    ).scalar_one()
+    return int(plan["Plan"]["Plan Rows"])
+
+
+def count(
+    model, *where: ColumnElement, upper_bound: Optional[int] = None
+) -> Tuple[int, bool]:
+    """Return the number of rows of ``model`` matching ``where`` and whether
+    the number is exact.
+
+    When the planner expects more than ``COUNT_ESTIMATE_THRESHOLD`` rows its
+    estimate is returned instead of counting them. ``upper_bound``, usually
+    the table total, skips the estimate for small tables and caps it.
+    """
+    threshold = settings.COUNT_ESTIMATE_THRESHOLD
+    if upper_bound is None or upper_bound > threshold:
+        rows = estimate(select(model.id).where(*where))
+        if rows is not None and rows > threshold:
+            if upper_bound is not None:
+                rows = min(rows, upper_bound)
+            return rows, False
+    stmt = select(func.count()).select_from(model).where(*where)
+    return db.session.execute(stmt).scalar_one(), True
@@ -0,0 +1,342 @@
+import base64
+import binascii
+import json
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+from sqlalchemy import bindparam, or_, select, tuple_
+from sqlalchemy.sql import ColumnElement, Select
+from werkzeug.exceptions import BadRequest
+
+from app import db
+from app.config import settings
+from app.utils import counts
+
+
+class Column:
+    """A column rendered by a DataTables table.
+
+    :param name: the ``columns[i][data]`` name used by the client.
+    :param expression: the SQL expression selected for the column, such as
+                       a model attribute or a correlated aggregate.
+    :param searchable: include the column in the global search.
+    :param sortable: allow ordering by the column.
+    :param search: build the search clause from the ``ILIKE`` pattern,
+                   defaults to ``expression ILIKE pattern``.
+    :param filter: build a clause from the ``columns[i][search][value]``
+                   sent for the column, or return ``None`` to ignore it.
+    :param render: convert the selected value for the JSON response.
+    :param export: convert the selected value for exports, defaults to
+                   the value itself.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        expression: ColumnElement,
+        searchable: bool = False,
+        sortable: bool = False,
+        search: Optional[Callable[[Any], ColumnElement]] = None,
+        filter: Optional[Callable[[str], Optional[ColumnElement]]] = None,
+        render: Optional[Callable[[Any], Any]] = None,
+        export: Optional[Callable[[Any], Any]] = None,
+    ) -> None:
+        self.name = name
+        self.expression = expression
+        self.searchable = searchable
+        self.sortable = sortable
+        self.search = search or (lambda pattern: expression.ilike(pattern))
+        self.filter = filter
+        self.render = render
+        self.export = export
+
+
+class Plan(NamedTuple):
+    draw: Optional[int]
+    search: str
+    order: Tuple[Tuple[str, bool], ...]
+    filters: Tuple[Tuple[str, str], ...]
+    start: int
+    length: int
+    cursor: Optional[Tuple[Any, int]]
+
+
+def like_pattern(search: str) -> str:
+    """Return a ``%search%`` pattern matching ``search`` literally."""
+    escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def encode_cursor(value: Any, id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([value, id]).encode()).decode()
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[Any, int]]:
+    """Return the ``(value, id)`` of a cursor, or ``None`` if invalid."""
+    if not cursor:
+        return None
+    try:
+        value, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, TypeError, ValueError):
+        return None
+    if not isinstance(id, int) or not isinstance(value, (str, int, float)):
+        return None
+    return value, id
+
+
+class DataTable:
+    """Server-side processing for a DataTables table over one model.
+
+    Each table declares its columns once; requests are parsed into a
+    :class:`Plan` and the SELECT for each (order, search) shape is built
+    once with bound parameters and reused across draws.
+
+    With ``keyset`` enabled, draws ordered by a single column return a
+    ``cursor`` for the last row. A draw sending that cursor back seeks past
+    it on the ``(column, id)`` index instead of skipping ``start`` rows;
+    draws without a cursor, such as a jump to an arbitrary page, still use
+    the offset.
+    """
+
+    def __init__(
+        self,
+        model,
+        columns: Iterable[Column],
+        default_order: str,
+        keyset: bool = False,
+    ) -> None:
+        self.model = model
+        self.columns = {column.name: column for column in columns}
+        self.default_order = default_order
+        self.keyset = keyset
+        self._statements: Dict[Tuple, Select] = {}
+        self._names = ["id", *self.columns]
+        self._renders = [None, *[c.render for c in self.columns.values()]]
+        self._exports = [None, *[c.export for c in self.columns.values()]]
+        self._sortable = sum(c.sortable for c in self.columns.values()) or 1
+
+    @property
+    def names(self) -> List[str]:
+        """The keys of each row: ``id`` followed by the column names."""
+        return self._names
+
+    def parse(self, args) -> Plan:
+        # Each column is ordered by at most once, which bounds the number of
+        # order shapes, and so of cached statements, per table.
+        order = []
+        ordered = set()
+        i = 0
+        while len(ordered) < self._sortable:
+            col_index = args.get(f"order[{i}][column]")
+            if col_index is None:
+                break
+            col_name = args.get(f"columns[{col_index}][data]")
+            column = self.columns.get(col_name)
+            if column is None or not column.sortable:
+                col_name = self.default_order
+            if col_name not in ordered:
+                ordered.add(col_name)
+                order.append((col_name, args.get(f"order[{i}][dir]") == "desc"))
+            i += 1
+
+        filters = []
+        i = 0
+        while True:
+            col_name = args.get(f"columns[{i}][data]")
+            if col_name is None:
+                break
+            value = args.get(f"columns[{i}][search][value]")
+            column = self.columns.get(col_name)
+            if value and column is not None and column.filter is not None:
+                filters.append((col_name, value))
+            i += 1
+
+        start = max(args.get("start", 0, type=int) or 0, 0)
+        length = args.get("length", settings.ROWS_PER_PAGE, type=int)
+        if length is None or length < 0 or length > settings.DATATABLES_MAX_LENGTH:
+            length = settings.DATATABLES_MAX_LENGTH
+
+        order = tuple(order) or ((self.default_order, False),)
+        cursor = decode_cursor(args.get("cursor")) if self.keyset else None
+        if cursor is not None and len(order) == 1:
+            self.check_cursor(order[0][0], cursor[0])
+
+        return Plan(
+            draw=args.get("draw", type=int),
+            search=args.get("search[value]", ""),
+            order=order,
+            filters=tuple(filters),
+            start=start,
+            length=length,
+            cursor=cursor,
+        )
+
+    def check_cursor(self, name: str, value: Any) -> None:
+        """Reject a cursor whose value cannot be compared to column ``name``."""
+        expected = self.columns[name].expression.type.python_type
+        if isinstance(value, bool) or not isinstance(value, expected):
+            raise BadRequest("Invalid cursor")
+
+    def seeks(self, plan: Plan) -> bool:
+        return plan.cursor is not None and len(plan.order) == 1
+
+    def statement(self, plan: Plan) -> Select:
+        """Return the page SELECT for the shape of ``plan``, with the
+        ``search``, ``cursor_*``, ``offset`` and ``limit`` bound parameters
+        unset."""
+        key = (plan.order, bool(plan.search), self.seeks(plan))
+        if key not in self._statements:
+            self._statements[key] = self._build(*key)
+        return self._statements[key]
+
+    def select(self, order: Tuple[Tuple[str, bool], ...]) -> Select:
+        """Return the projected columns ordered by ``order``, then by id."""
+        stmt = select(
+            self.model.id,
+            *[column.expression.label(name) for name, column in self.columns.items()],
+        )
+        clauses = []
+        for name, descending in order:
+            expression = self.columns[name].expression
+            clauses.append(expression.desc() if descending else expression)
+        # Ties are broken in the direction of the primary sort, which is
+        # also the direction the cursor seeks in.
+        id_descending = order[0][1]
+        return stmt.order_by(
+            *clauses, self.model.id.desc() if id_descending else self.model.id
+        )
+
+    def _build(
+        self, order: Tuple[Tuple[str, bool], ...], searching: bool, seeking: bool
+    ) -> Select:
+        stmt = self.select(order)
+        if searching:
+            stmt = stmt.where(self.search_clause(bindparam("search")))
+        if seeking:
+            name, descending = order[0]
+            key = tuple_(self.columns[name].expression, self.model.id)
+            cursor = tuple_(bindparam("cursor_value"), bindparam("cursor_id"))
+            stmt = stmt.where(key < cursor if descending else key > cursor)
+        return stmt.offset(bindparam("offset")).limit(bindparam("limit"))
+
+    def search_clause(self, pattern) -> ColumnElement:
+        return or_(
+            *[
+                column.search(pattern)
+                for column in self.columns.values()
+                if column.searchable
+            ]
+        )
+
+    def filter_clauses(self, plan: Plan) -> List[ColumnElement]:
+        clauses = []
+        for name, value in plan.filters:
+            clause = self.columns[name].filter(value)
+            if clause is not None:
+                clauses.append(clause)
+        return clauses
+
+    def matching(self, plan: Plan) -> List[ColumnElement]:
+        """Return the column filter and search clauses of ``plan``."""
+        clauses = self.filter_clauses(plan)
+        if plan.search:
+            clauses.append(self.search_clause(like_pattern(plan.search)))
+        return clauses
+
+    def counts(
+        self, where: List[ColumnElement], filtered_where: List[ColumnElement]
+    ) -> Tuple[int, bool, int, bool]:
+        """Return the total and filtered counts, each with its exactness.
+
+        The table total comes from the count cache; scoped and filtered
+        counts may be planner estimates on large tables.
+        """
+        total = counts.total(self.model)
+        total_exact = True
+        if where:
+            total, total_exact = counts.count(self.model, *where, upper_bound=total)
+        if len(filtered_where) == len(where):
+            return total, total_exact, total, total_exact
+        filtered, filtered_exact = counts.count(
+            self.model, *filtered_where, upper_bound=total
+        )
+        return total, total_exact, filtered, filtered_exact
+
+    def rows(self, result, export: bool = False) -> List[dict]:
+        names = self._names
+        renders = self._exports if export else self._renders
+        return [
+            {
+                name: render(value) if render else value
+                for name, render, value in zip(names, renders, row)
+            }
+            for row in result
+        ]
+
+    def draw(self, args, where: Iterable[ColumnElement] = ()) -> dict:
+        """Answer one DataTables draw, optionally scoped by ``where``."""
+        plan = self.parse(args)
+        where = list(where)
+        filtered_where = where + self.filter_clauses(plan)
+        params = {"offset": plan.start, "limit": plan.length}
+        if self.seeks(plan):
+            params.update(
+                offset=0, cursor_value=plan.cursor[0], cursor_id=plan.cursor[1]
+            )
+        if plan.search:
+            params["search"] = like_pattern(plan.search)
+
+        count_where = list(filtered_where)
+        if plan.search:
+            count_where.append(self.search_clause(params["search"]))
+        total, total_exact, filtered, filtered_exact = self.counts(where, count_where)
+
+        stmt = self.statement(plan).where(*filtered_where)
+        result = db.session.execute(stmt, params).all()
+        if not filtered_exact and not self.seeks(plan):
+            # The page itself bounds an estimate: a short page ends the result.
+            if len(result) < plan.length:
+                filtered, filtered_exact = plan.start + len(result), True
+            else:
+                filtered = max(filtered, plan.start + len(result))
+        response = {
+            "data": self.rows(result),
+            "recordsFiltered": filtered,
+            "recordsTotal": total,
+            "recordsFilteredExact": filtered_exact,
+            "recordsTotalExact": total_exact,
+        }
+        if plan.draw is not None:
+            response["draw"] = plan.draw
+        if self.keyset and len(plan.order) == 1 and result:
+            last = result[-1]._mapping
+            response["cursor"] = encode_cursor(last[plan.order[0][0]], last["id"])
+            # The client keys the cursor on the page of the request that
+            # produced it, not on whichever request it sent last.
+            response["start"] = plan.start
+        return response
+
+    def stream(
+        self, args, where: Iterable[ColumnElement] = (), batch_size: int = 1000
+    ) -> Iterator[List[dict]]:
+        """Yield every row matching the search, filters and order of
+        ``args`` as export rows, in lists of up to ``batch_size``.
+
+        Rows are read from a server side cursor on a dedicated connection,
+        so memory use does not grow with the number of rows.
+        """
+        plan = self.parse(args)
+        stmt = self.select(plan.order).where(*where, *self.matching(plan))
+        with db.engine.connect() as connection:
+            result = connection.execution_options(yield_per=batch_size).execute(stmt)
+            for partition in result.partitions():
+                yield self.rows(partition, export=True)
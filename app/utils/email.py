@@ -1,18 +1,211 @@
-from threading import Thread
+import atexit
+import logging
+import os
+import smtplib
+import time
+import uuid
+from functools import lru_cache
+from html.parser import HTMLParser
+from queue import Empty, Full, Queue
+from threading import Lock, Thread
+from typing import Dict, List, Optional, Tuple
 
+from flask import render_template, request
+from flask_babel import get_locale
 from flask_mail import Message
+from sqlalchemy import func, insert, literal, select
+from sqlalchemy.sql import Select
+from werkzeug.exceptions import ServiceUnavailable
 
-from app import app, mail
+from app import app, db, mail
+from app.config import settings
+from app.models import Outbox
 
+logger = logging.getLogger(__name__)
 
-def send_async_email(app, msg):
-    with app.app_context():
-        mail.send(msg)
+_STOP = object()
+
+TOKEN_SLOT = "TOKENSLOT0x5f3759df"
+
+
+class MailDispatcher:
+    """Deliver mail from a bounded queue with a fixed pool of sender threads.
+
+    Each sender keeps one SMTP connection open while messages keep coming,
+    sending up to ``max_per_connection`` messages before reconnecting, and
+    closes it after ``idle_timeout`` seconds without mail. Failed messages
+    are retried on a new connection. The queue is drained on shutdown.
+    """
+
+    def __init__(
+        self,
+        senders: int,
+        queue_size: int,
+        max_per_connection: int,
+        idle_timeout: int,
+        max_retries: int,
+    ) -> None:
+        self.senders = senders
+        self.max_per_connection = max_per_connection
+        self.idle_timeout = idle_timeout
+        self.max_retries = max_retries
+        self._queue: Queue = Queue(maxsize=queue_size)
+        self._threads: List[Thread] = []
+        self._pid: Optional[int] = None
+        self._lock = Lock()
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = Queue(maxsize=self._queue.maxsize)
+            self._threads = [
+                Thread(target=self._run, name=f"mail-sender-{i}", daemon=True)
+                for i in range(self.senders)
+            ]
+            for thread in self._threads:
+                thread.start()
+            self._pid = os.getpid()
+
+    def submit(self, message: Message) -> None:
+        self._start()
+        try:
+            self._queue.put((message, 0), timeout=1)
+        except Full:
+            logger.error("Mail queue full, message to %s rejected", message.recipients)
+            raise ServiceUnavailable(retry_after=5)
+
+    def stop(self, timeout: float = 30) -> None:
+        if self._pid != os.getpid():
+            return
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        self._pid = None
+
+    def _next(self):
+        try:
+            return self._queue.get(timeout=self.idle_timeout)
+        except Empty:
+            return None
+
+    def _run(self) -> None:
+        with app.app_context():
+            item = self._queue.get()
+            while item is not _STOP:
+                item = self._session(item)
+                if item is None:
+                    item = self._queue.get()
+
+    def _session(self, item):
+        """Send ``item`` and whatever follows it over one connection.
+
+        Returns the next queued item, or ``None`` if the queue went idle.
+        """
+        message, attempts = item
+        try:
+            with mail.connect() as connection:
+                for _ in range(self.max_per_connection):
+                    connection.send(message)
+                    item = self._next()
+                    if item is None or item is _STOP:
+                        return item
+                    message, attempts = item
+                return item
+        except (smtplib.SMTPException, OSError):
+            if attempts >= self.max_retries:
+                logger.exception("Mail to %s dropped", message.recipients)
+                return None
+            logger.warning("Mail to %s failed, reconnecting", message.recipients)
+            time.sleep(2**attempts)
+            return (message, attempts + 1)
+        except Exception:
+            logger.exception("Mail to %s dropped", message.recipients)
+            return None
+
+
+mail_dispatcher = MailDispatcher(
+    senders=settings.MAIL_SENDERS,
+    queue_size=settings.MAIL_QUEUE_SIZE,
+    max_per_connection=settings.MAIL_MAX_PER_CONNECTION,
+    idle_timeout=settings.MAIL_IDLE_TIMEOUT,
+    max_retries=settings.MAIL_MAX_RETRIES,
+)
+atexit.register(mail_dispatcher.stop)
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self) -> None:
+        super().__init__()
+        self.lines: List[str] = []
+        self._skip = 0
+        self._href: Optional[str] = None
+
+    def handle_starttag(self, tag, attrs) -> None:
+        if tag in ("head", "style", "script"):
+            self._skip += 1
+        elif tag == "a":
+            self._href = dict(attrs).get("href")
+
+    def handle_endtag(self, tag) -> None:
+        if tag in ("head", "style", "script"):
+            self._skip -= 1
+        elif tag == "a" and self._href:
+            self.lines.append(self._href)
+            self._href = None
+
+    def handle_data(self, data) -> None:
+        if not self._skip and data.strip():
+            self.lines.append(" ".join(data.split()))
+
+
+def html_to_text(html: str) -> str:
+    parser = _TextExtractor()
+    parser.feed(html)
+    return "\n\n".join(parser.lines)
+
+
+@lru_cache(maxsize=64)
+def _compile_email(
+    template: str, locale: str, host_url: str, **context
+) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    html = render_template(template, token=TOKEN_SLOT, **context)
+    return tuple(html.split(TOKEN_SLOT)), tuple(html_to_text(html).split(TOKEN_SLOT))
+
+
+def render_email(template: str, token: str, **context) -> Tuple[str, str]:
+    """Render the html and text bodies of a transactional email.
+
+    Each (template, locale, host) is rendered once into a skeleton with a
+    slot for the token, so later messages only cost a string join.
+    """
+    html_parts, text_parts = _compile_email(
+        template, str(get_locale()), request.host_url, **context
+    )
+    return token.join(html_parts), token.join(text_parts)
 
 
 def send_email(
     subject, sender, recipients, text_body, html_body, attachments=None, sync=False
 ):
+    """Send a message, by default through the outbox.
+
+    Outbox messages are only added to the session; they are sent by the
+    mail worker once the caller commits.
+    """
+    if settings.MAIL_USE_OUTBOX and not sync and not attachments:
+        db.session.add(
+            Outbox(
+                subject=str(subject),
+                sender=sender,
+                recipients=list(recipients),
+                text_body=text_body,
+                html_body=html_body,
+            )
+        )
+        return
     msg = Message(subject, sender=sender, recipients=recipients)
     msg.body = text_body
     msg.html = html_body
@@ -22,4 +215,106 @@ def send_email(
     if sync:
         mail.send(msg)
     else:
-        Thread(target=send_async_email, args=[app, msg]).start()
+        mail_dispatcher.submit(msg)
+
+
+def send_bulk_email(subject, sender, recipients, text_body, html_body) -> None:
+    """Send the same message to each of ``recipients`` individually.
+
+    With the outbox the rows are inserted in one statement and committed.
+    """
+    if not settings.MAIL_USE_OUTBOX:
+        for recipient in recipients:
+            send_email(subject, sender, [recipient], text_body, html_body)
+        return
+    db.session.execute(
+        insert(Outbox),
+        [
+            dict(
+                subject=str(subject),
+                sender=sender,
+                recipients=[recipient],
+                text_body=text_body,
+                html_body=html_body,
+            )
+            for recipient in recipients
+        ],
+    )
+    db.session.commit()
+
+
+def queue_bulk_email(
+    subject, sender, recipients: Select, text_body, html_body
+) -> Tuple[str, int]:
+    """Queue the same message to each email selected by ``recipients`` with
+    a single ``INSERT ... SELECT`` into the outbox, and commit.
+
+    Returns the batch id of the queued messages and how many were queued.
+    """
+    batch = uuid.uuid4().hex
+    emails = recipients.subquery()
+    stmt = insert(Outbox).from_select(
+        ["subject", "sender", "recipients", "text_body", "html_body", "batch"],
+        select(
+            literal(str(subject)),
+            literal(sender),
+            func.json_build_array(emails.c[0]),
+            literal(text_body),
+            literal(html_body),
+            literal(batch),
+        ),
+    )
+    queued = db.session.execute(stmt).rowcount
+    db.session.commit()
+    return batch, queued
+
+
+def outbox_progress(batch: str) -> Dict[str, int]:
+    """Return the number of messages of ``batch`` by status."""
+    stmt = (
+        select(Outbox.status, func.count())
+        .where(Outbox.batch == batch)
+        .group_by(Outbox.status)
+    )
+    return dict(db.session.execute(stmt).all())
+
+
+def deliver_outbox(batch_size: int) -> int:
+    """Claim a batch of due outbox messages and send them over one connection.
+
+    Rows are locked with ``FOR UPDATE SKIP LOCKED`` so several workers can
+    drain the outbox side by side. If the connection drops, only the message
+    in flight is charged an attempt; the rest of the batch stays pending and
+    is claimed again. Returns the number of messages sent or charged.
+    """
+    batch = (
+        db.session.execute(
+            select(Outbox)
+            .where(Outbox.status == "pending", Outbox.next_attempt_at <= func.now())
+            .order_by(Outbox.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        .scalars()
+        .all()
+    )
+    handled = 0
+    try:
+        if batch:
+            with mail.connect() as connection:
+                for entry in batch:
+                    handled += 1
+                    try:
+                        connection.send(entry.to_message())
+                    except (smtplib.SMTPServerDisconnected, OSError) as e:
+                        entry.mark_failed(e)
+                        raise
+                    except smtplib.SMTPException as e:
+                        logger.warning("Outbox message %d failed: %r", entry.id, e)
+                        entry.mark_failed(e)
+                    else:
+                        entry.mark_sent()
+    except (smtplib.SMTPException, OSError) as e:
+        logger.warning("Outbox delivery interrupted: %r", e)
+    db.session.commit()
+    return handled
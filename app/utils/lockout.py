@@ -0,0 +1,38 @@
+from app import cache
+from app.config import settings
+
+
+def _failures_key(user_id: int) -> str:
+    return f"lockout:failures:{user_id}"
+
+
+def _locked_key(user_id: int) -> str:
+    return f"lockout:locked:{user_id}"
+
+
+def record_failure(user_id: int) -> bool:
+    """Count a failed login and lock the account once the limit is reached.
+
+    Failures are counted within ``LOCK_TIME``; a lock lasts ``BLOCK_TIME``.
+    Returns ``True`` if this failure locked the account.
+    """
+    key = _failures_key(user_id)
+    cache.add(key, 0, timeout=int(settings.LOCK_TIME.total_seconds()))
+    failures = cache.cache.inc(key) or 0
+    if failures < settings.MAX_LOGIN_ATTEMPTS:
+        return False
+    cache.set(
+        _locked_key(user_id), True, timeout=int(settings.BLOCK_TIME.total_seconds())
+    )
+    cache.delete(key)
+    return True
+
+
+def clear(user_id: int) -> None:
+    key = _failures_key(user_id)
+    if cache.get(key):
+        cache.delete(key)
+
+
+def is_locked(user_id: int) -> bool:
+    return cache.has(_locked_key(user_id))
@@ -0,0 +1,155 @@
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from threading import BoundedSemaphore, Lock
+from typing import Optional
+
+import bcrypt
+from werkzeug.exceptions import ServiceUnavailable
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PasswordHasher:
+    """Run bcrypt in a process pool so hashing never blocks a web worker.
+
+    At most ``workers`` hashes run at once and ``queue_size`` more may wait.
+    Past that, requests fail fast with 503 instead of piling up. A hash the
+    caller stopped waiting for keeps its slot until it finishes. If a pool
+    process dies the pool is rebuilt and the hash retried once.
+    """
+
+    def __init__(self, workers: int, queue_size: int, timeout: int) -> None:
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = BoundedSemaphore(workers + queue_size)
+        self._lock = Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self.pending = 0
+        self.count = 0
+        self.rejected = 0
+        self.total_time = 0.0
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, fn, *args):
+        for _ in range(2):
+            try:
+                return self._submit(fn, *args)
+            except BrokenProcessPool:
+                logger.warning("Password hashing pool broke, restarting it")
+        raise ServiceUnavailable(retry_after=1)
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            logger.warning("Password hashing queue full (%d pending)", self.pending)
+            raise ServiceUnavailable(retry_after=1)
+        with self._lock:
+            self.pending += 1
+        start = time.perf_counter()
+        executor = self.executor
+        try:
+            future = executor.submit(fn, *args)
+        except BaseException as e:
+            self._release(start)
+            if isinstance(e, BrokenProcessPool):
+                self._discard(executor)
+            raise
+        future.add_done_callback(lambda _: self._release(start))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise ServiceUnavailable(retry_after=1)
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise
+
+    def _discard(self, executor: ProcessPoolExecutor) -> None:
+        """Drop a broken pool so the next hash starts a new one."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def _release(self, start: float) -> None:
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.pending -= 1
+            self.count += 1
+            self.total_time += elapsed
+        self._slots.release()
+        logger.debug("Password hash took %.0fms", elapsed * 1000)
+
+    def hash(self, password: str, rounds: int) -> str:
+        pw_hash = self._run(
+            bcrypt.hashpw, password.encode("utf-8"), bcrypt.gensalt(rounds)
+        )
+        return pw_hash.decode("utf-8")
+
+    def check(self, pw_hash: str, password: str) -> bool:
+        try:
+            return self._run(
+                bcrypt.checkpw, password.encode("utf-8"), pw_hash.encode("utf-8")
+            )
+        except ValueError:
+            return False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queue_depth": self.pending,
+                "hashes": self.count,
+                "rejected": self.rejected,
+                "avg_latency_ms": (
+                    round(self.total_time / self.count * 1000, 1) if self.count else 0
+                ),
+            }
+
+
+def get_rounds(pw_hash: str) -> Optional[int]:
+    """Return the cost factor stored in a ``$2b$12$...`` bcrypt hash."""
+    try:
+        return int(pw_hash.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def needs_rehash(pw_hash: str) -> bool:
+    return get_rounds(pw_hash) != settings.BCRYPT_LOG_ROUNDS
+
+
+def measure(rounds: int, samples: int = 3) -> float:
+    """Return the fastest of ``samples`` hashes at ``rounds``, in ms."""
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        bcrypt.hashpw(b"calibration", bcrypt.gensalt(rounds))
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+# Each web worker gets its share of the host's cores and queue.
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS
+    or max(1, (os.cpu_count() or 1) // settings.WEB_CONCURRENCY),
+    queue_size=max(1, settings.PASSWORD_HASH_QUEUE_SIZE // settings.WEB_CONCURRENCY),
+    timeout=settings.PASSWORD_HASH_TIMEOUT,
+)
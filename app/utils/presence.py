@@ -0,0 +1,99 @@
+import atexit
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from typing import Dict, Optional
+
+from sqlalchemy import bindparam, column, or_, table
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import app, db
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+users = table("users", column("id"), column("last_seen"))
+
+
+class LastSeenWriter:
+    """Write-behind buffer for ``users.last_seen``.
+
+    Hits are coalesced per user in memory and written with a single bulk
+    UPDATE once the flush interval has elapsed or the buffer is full. Hits
+    within ``granularity`` of the stored or last flushed value are dropped.
+    """
+
+    def __init__(
+        self, granularity: timedelta, flush_interval: timedelta, flush_size: int
+    ) -> None:
+        self.granularity = granularity
+        self.flush_interval = flush_interval.total_seconds()
+        self.flush_size = flush_size
+        self._pending: Dict[int, datetime] = {}
+        self._flushed: Dict[int, datetime] = {}
+        self._lock = Lock()
+        self._last_flush = time.monotonic()
+
+    def touch(self, user_id: int, last_seen: Optional[datetime] = None) -> None:
+        now = datetime.now(timezone.utc)
+        if last_seen is not None and last_seen.tzinfo is None:
+            last_seen = last_seen.replace(tzinfo=timezone.utc)
+        flushed = self._flushed.get(user_id)
+        if flushed is not None and (last_seen is None or flushed > last_seen):
+            last_seen = flushed
+        if last_seen is not None and now - last_seen < self.granularity:
+            return
+        with self._lock:
+            self._pending[user_id] = now
+            due = (
+                len(self._pending) >= self.flush_size
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        if due:
+            self.flush()
+
+    def flush(self) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            # Remember every user flushed within the granularity, not just
+            # this batch, so their next hits keep being dropped.
+            cutoff = datetime.now(timezone.utc) - self.granularity
+            flushed = {k: v for k, v in self._flushed.items() if v >= cutoff}
+            flushed.update(pending)
+            self._flushed = flushed
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+        stmt = (
+            users.update()
+            .where(users.c.id == bindparam("user_id"))
+            .where(
+                or_(
+                    users.c.last_seen.is_(None),
+                    users.c.last_seen < bindparam("seen"),
+                )
+            )
+            .values(last_seen=bindparam("seen"))
+        )
+        params = [{"user_id": k, "seen": v} for k, v in pending.items()]
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(stmt, params)
+        except SQLAlchemyError:
+            logger.exception("Could not flush last_seen for %d users", len(params))
+            return 0
+        return len(params)
+
+
+last_seen_writer = LastSeenWriter(
+    granularity=settings.LAST_SEEN_GRANULARITY,
+    flush_interval=settings.LAST_SEEN_FLUSH_INTERVAL,
+    flush_size=settings.LAST_SEEN_FLUSH_SIZE,
+)
+
+
+@atexit.register
+def flush_on_exit() -> None:
+    with app.app_context():
+        last_seen_writer.flush()
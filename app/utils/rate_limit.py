@@ -0,0 +1,28 @@
+import math
+import time
+from typing import Optional
+
+from app import cache
+
+
+def hit(key: str, limit: int, window: int) -> Optional[int]:
+    """Count a hit on ``key`` and check it against ``limit`` per ``window``.
+
+    Uses a sliding window counter: the previous fixed window is weighted by
+    how much of it still overlaps the sliding one. Counters live in the app
+    cache, so every worker sharing the cache shares the limits.
+
+    :returns: ``None`` if the hit is allowed, otherwise the number of
+              seconds to wait before retrying.
+    """
+    now = time.time()
+    index = int(now // window)
+    elapsed = now - index * window
+    current_key = f"rate:{key}:{index}"
+    cache.add(current_key, 0, timeout=window * 2)
+    current = cache.cache.inc(current_key) or 0
+    previous = cache.get(f"rate:{key}:{index - 1}") or 0
+    estimate = previous * (window - elapsed) / window + current
+    if estimate <= limit:
+        return None
+    return max(1, math.ceil(window - elapsed))
@@ -0,0 +1,279 @@
+import logging
+import os
+import pickle  # nosec B403
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, List, Optional
+
+from flask_caching.backends.base import BaseCache
+
+logger = logging.getLogger(__name__)
+
+SUFFIXES = ("", "-wal", "-shm")
+
+
+def check_private(path: str) -> None:
+    """Create the cache database at ``path`` readable only by the current
+    user, and refuse a database or journal file owned by anyone else.
+
+    Cached values are unpickled, so whoever can write the file can run code
+    in the app.
+    """
+    for suffix in SUFFIXES:
+        flags = os.O_RDWR | os.O_NOFOLLOW | (os.O_CREAT if not suffix else 0)
+        try:
+            fd = os.open(path + suffix, flags, 0o600)
+        except FileNotFoundError:
+            continue
+        try:
+            stat = os.fstat(fd)
+            if stat.st_uid != os.getuid():
+                raise RuntimeError(
+                    f"Cache file {path + suffix} is owned by another user"
+                )
+            if stat.st_mode & 0o077:
+                os.fchmod(fd, 0o600)
+        finally:
+            os.close(fd)
+
+
+class SQLiteCache(BaseCache):
+    """Cache shared by every worker process on a host.
+
+    Entries live in a SQLite database in WAL mode, so readers never block
+    each other and a write in one worker is visible to all of them. Each
+    process opens its own connection after fork. Once the cache holds more
+    than ``threshold`` entries the least recently used ones are evicted.
+
+    :param path: the SQLite database file, created private to the current
+                 user; files owned by another user are refused.
+    :param threshold: the maximum number of entries kept.
+    :param default_timeout: the default timeout, ``0`` never expires.
+    :param touch_interval: seconds between access time updates of an entry,
+                           so hot keys do not turn every read into a write.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        threshold: int = 10000,
+        default_timeout: int = 300,
+        touch_interval: int = 60,
+    ) -> None:
+        super().__init__(default_timeout=default_timeout)
+        check_private(path)
+        self.path = path
+        self.threshold = threshold
+        self.touch_interval = touch_interval
+        self._local = threading.local()
+        self._writes = 0
+        self._execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+            "expires REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._execute(
+            "CREATE INDEX IF NOT EXISTS ix_cache_accessed ON cache (accessed)"
+        )
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        path = config["CACHE_SQLITE_PATH"]
+        if path is None:
+            os.makedirs(app.instance_path, mode=0o700, exist_ok=True)
+            path = os.path.join(app.instance_path, "cache.sqlite")
+        kwargs.update(
+            dict(
+                path=path,
+                threshold=config["CACHE_THRESHOLD"],
+            )
+        )
+        return cls(*args, **kwargs)
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        pid = os.getpid()
+        if getattr(self._local, "pid", None) != pid:
+            connection = sqlite3.connect(
+                self.path, timeout=5, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = pid
+        return self._local.connection
+
+    def _execute(self, sql: str, params=()) -> sqlite3.Cursor:
+        return self._connection.execute(sql, params)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        connection = self._connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    @staticmethod
+    def _dumps(value: Any) -> bytes:
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def _expires(self, timeout: Optional[int]) -> float:
+        timeout = self._normalize_timeout(timeout)
+        return time.time() + timeout if timeout > 0 else 0
+
+    @staticmethod
+    def _loads(value: bytes) -> Any:
+        try:
+            return pickle.loads(value)  # nosec B301
+        except Exception:
+            return None
+
+    def _prune(self) -> None:
+        self._writes += 1
+        if self._writes % 100:
+            return
+        now = time.time()
+        self._execute("DELETE FROM cache WHERE expires != 0 AND expires <= ?", (now,))
+        (count,) = self._execute("SELECT count(*) FROM cache").fetchone()
+        if count > self.threshold:
+            self._execute(
+                "DELETE FROM cache WHERE key IN "
+                "(SELECT key FROM cache ORDER BY accessed LIMIT ?)",
+                (count - self.threshold,),
+            )
+
+    def get(self, key: str) -> Any:
+        return self.get_many(key)[0]
+
+    def get_many(self, *keys: str) -> List[Any]:
+        if not keys:
+            return []
+        now = time.time()
+        try:
+            rows = self._execute(
+                "SELECT key, value, expires, accessed FROM cache "
+                f"WHERE key IN ({','.join('?' * len(keys))})",  # nosec B608
+                keys,
+            ).fetchall()
+            found = {}
+            stale = []
+            for key, value, expires, accessed in rows:
+                if expires != 0 and expires <= now:
+                    continue
+                found[key] = self._loads(value)
+                if now - accessed > self.touch_interval:
+                    stale.append((now, key))
+            if stale:
+                self._connection.executemany(
+                    "UPDATE cache SET accessed = ? WHERE key = ?", stale
+                )
+        except sqlite3.Error:
+            logger.exception("Cache read failed")
+            return [None] * len(keys)
+        return [found.get(key) for key in keys]
+
+    def set(self, key: str, value: Any, timeout: Optional[int] = None) -> bool:
+        return self.set_many({key: value}, timeout) == [key]
+
+    def set_many(self, mapping, timeout: Optional[int] = None) -> List[Any]:
+        expires = self._expires(timeout)
+        now = time.time()
+        rows = [
+            (key, self._dumps(value), expires, now) for key, value in mapping.items()
+        ]
+        try:
+            with self._transaction() as connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO cache (key, value, expires, accessed) "
+                    "VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+            self._prune()
+        except sqlite3.Error:
+            logger.exception("Cache write failed")
+            return []
+        return [row[0] for row in rows]
+
+    def add(self, key: str, value: Any, timeout: Optional[int] = None) -> bool:
+        now = time.time()
+        row = (key, self._dumps(value), self._expires(timeout), now)
+        try:
+            with self._transaction() as connection:
+                connection.execute(
+                    "DELETE FROM cache "
+                    "WHERE key = ? AND expires != 0 AND expires <= ?",
+                    (key, now),
+                )
+                cursor = connection.execute(
+                    "INSERT OR IGNORE INTO cache (key, value, expires, accessed) "
+                    "VALUES (?, ?, ?, ?)",
+                    row,
+                )
+            self._prune()
+        except sqlite3.Error:
+            logger.exception("Cache write failed")
+            return False
+        return cursor.rowcount == 1
+
+    def inc(self, key: str, delta: int = 1) -> Optional[int]:
+        now = time.time()
+        try:
+            with self._transaction() as connection:
+                row = connection.execute(
+                    "SELECT value, expires FROM cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None or (row[1] != 0 and row[1] <= now):
+                    value, expires = delta, self._expires(None)
+                else:
+                    value, expires = (self._loads(row[0]) or 0) + delta, row[1]
+                connection.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, expires, accessed) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, self._dumps(value), expires, now),
+                )
+        except sqlite3.Error:
+            logger.exception("Cache write failed")
+            return None
+        return value
+
+    def dec(self, key: str, delta: int = 1) -> Optional[int]:
+        return self.inc(key, -delta)
+
+    def has(self, key: str) -> bool:
+        try:
+            row = self._execute(
+                "SELECT 1 FROM cache WHERE key = ? AND (expires = 0 OR expires > ?)",
+                (key, time.time()),
+            ).fetchone()
+        except sqlite3.Error:
+            logger.exception("Cache read failed")
+            return False
+        return row is not None
+
+    def delete(self, key: str) -> bool:
+        return self.delete_many(key) == [key]
+
+    def delete_many(self, *keys: str) -> List[Any]:
+        try:
+            with self._transaction() as connection:
+                connection.executemany(
+                    "DELETE FROM cache WHERE key = ?", [(key,) for key in keys]
+                )
+        except sqlite3.Error:
+            logger.exception("Cache write failed")
+            return []
+        return list(keys)
+
+    def clear(self) -> bool:
+        try:
+            self._execute("DELETE FROM cache")
+        except sqlite3.Error:
+            logger.exception("Cache write failed")
+            return False
+        return True
@@ -0,0 +1,32 @@
+import time
+
+from app import cache
+
+
+def _key(name: str) -> str:
+    return f"version:{name}"
+
+
+def get_version(name: str) -> int:
+    """Return the current version of ``name``, creating one if missing."""
+    version = cache.get(_key(name))
+    if version is None:
+        cache.add(_key(name), time.time_ns(), timeout=0)
+        version = cache.get(_key(name))
+    return version
+
+
+def get_versions(*names: str) -> tuple:
+    """Return the current versions of ``names`` with a single cache read."""
+    versions = cache.get_many(*[_key(name) for name in names])
+    return tuple(
+        get_version(name) if version is None else version
+        for name, version in zip(names, versions)
+    )
+
+
+def bump_version(name: str) -> int:
+    """Invalidate everything cached under the current version of ``name``."""
+    version = time.time_ns()
+    cache.set(_key(name), version, timeout=0)
+    return version
@@ -8,8 +8,9 @@ from wtforms import (
     SelectMultipleField,
     StringField,
     SubmitField,
+    TextAreaField,
 )
-from wtforms.validators import DataRequired, Email, Length, ValidationError
+from wtforms.validators import AnyOf, DataRequired, Email, Length, ValidationError
 
 from app import db
 from app.models import Permission, Role, User
@@ -272,3 +273,25 @@ class CreateUserForm(FlaskForm):
                 + f" {field.data} "
                 + lazy_gettext("already exists.")
             )
+
+
+class BroadcastForm(FlaskForm):
+    subject = StringField(
+        lazy_gettext("Subject"), validators=[DataRequired(), Length(min=2, max=255)]
+    )
+    body = TextAreaField(
+        lazy_gettext("Message"),
+        validators=[DataRequired()],
+        render_kw={"rows": 10},
+    )
+    submit = SubmitField(lazy_gettext("Send"))
+
+
+class BulkRoleUsersForm(FlaskForm):
+    user_ids = HiddenField()
+    scope = HiddenField(
+        default="selected", validators=[AnyOf(["selected", "matching"])]
+    )
+
+    def selected_ids(self):
+        return [int(id) for id in (self.user_ids.data or "").split(",") if id.isdigit()]
@@ -1,11 +1,11 @@
 from flask import Blueprint, redirect, render_template, request, url_for
 from flask_login import login_required
-from sqlalchemy import or_
 
-from app.decorators import admin_required
+from app.decorators import admin_required, etag
 from app.models import Permission
 
 from .forms import EditPermissionForm, PermissionForm
+from .tables import permissions_table
 
 permission_bp = Blueprint(
     "permissions",
@@ -74,47 +74,6 @@ def delete_permission(id):
 @permission_bp.route("/get_data", methods=["GET"])
 @login_required
 @admin_required
+@etag("permissions")
 def get_data_permission():
-    query = Permission.query
-
-    # search filter
-    search = request.args.get("search[value]")
-    if search:
-        query = query.filter(
-            or_(
-                Permission.name.like(f"%{search}%"),
-            )
-        )
-    total_filtered = query.count()
-
-    # sorting
-    order = []
-    i = 0
-    while True:
-        col_index = request.args.get(f"order[{i}][column]")
-        if col_index is None:
-            break
-        col_name = request.args.get(f"columns[{col_index}][data]")
-        if col_name not in ["name"]:
-            col_name = "name"
-        descending = request.args.get(f"order[{i}][dir]") == "desc"
-        col = getattr(Permission, col_name)
-        if descending:
-            col = col.desc()
-        order.append(col)
-        i += 1
-    if order:
-        query = query.order_by(*order)
-
-    # pagination
-    start = request.args.get("start", type=int)
-    length = request.args.get("length", type=int)
-    query = query.offset(start).limit(length)
-
-    # response
-    return {
-        "data": [user.to_dict() for user in query],
-        "recordsFiltered": total_filtered,
-        "recordsTotal": Permission.query.count(),
-        "draw": request.args.get("draw", type=int),
-    }
+    return permissions_table.draw(request.args)
@@ -1,11 +1,29 @@
-from flask import Blueprint, redirect, render_template, request, url_for
-from flask_login import login_required
-from sqlalchemy import or_
+import logging
+from typing import Optional
+
+from flask import (
+    Blueprint,
+    abort,
+    flash,
+    redirect,
+    render_template,
+    request,
+    url_for,
+)
+from flask_babel import _
+from flask_login import current_user, login_required
+from sqlalchemy import ARRAY, Integer, any_, literal
 
-from app.decorators import admin_required
+from app.config import settings
+from app.decorators import admin_required, etag
 from app.models import Permission, Role, User
+from app.utils.email import outbox_progress, queue_bulk_email, send_bulk_email
+from app.utils.export import export_response
+
+from .forms import BroadcastForm, BulkRoleUsersForm, CreateRoleForm, EditRoleForm
+from .tables import role_users_table, roles_table, users_table
 
-from .forms import CreateRoleForm, EditRoleForm
+logger = logging.getLogger(__name__)
 
 roles_bp = Blueprint(
     "roles",
@@ -19,9 +37,14 @@ roles_bp = Blueprint(
 @roles_bp.route("/", methods=["GET", "POST"])
 @login_required
 @admin_required
+@etag("roles", "users")
 def roles_view():
     user_roles = Role.query.all()
-    return render_template("admin/roles/list.html", user_roles=user_roles)
+    return render_template(
+        "admin/roles/list.html",
+        user_roles=user_roles,
+        member_counts=Role.member_counts(),
+    )
 
 
 @roles_bp.route("/create", methods=["GET", "POST"])
@@ -96,118 +119,169 @@ def add_user_to_role(role_id, user_id):
     return redirect(url_for("admin.roles.view_role", id=role_id))
 
 
+def bulk_users(form: BulkRoleUsersForm) -> Optional[list]:
+    """Return the clauses selecting the users of a bulk role change: the
+    ids selected in the table, or every user matching the table search and
+    filters sent in the query string.
+
+    Return ``None`` for a ``matching`` change without a search or filter,
+    which would otherwise apply to every user.
+    """
+    if form.scope.data == "matching":
+        clauses = users_table.matching(users_table.parse(request.args))
+        return clauses or None
+    return [User.id == any_(literal(form.selected_ids(), ARRAY(Integer)))]
+
+
+@roles_bp.route("/add_users/<int:role_id>", methods=["POST"])
+@login_required
+@admin_required
+def add_users_to_role(role_id):
+    role = Role.query.get_or_404(role_id)
+    form = BulkRoleUsersForm()
+    if form.validate_on_submit():
+        where = bulk_users(form)
+        if where is None:
+            flash(_("Search or filter the users first"), category="warning")
+        else:
+            added = role.add_members(*where)
+            flash(
+                _("%(count)d users added to the role", count=added),
+                category="success",
+            )
+    return redirect(url_for("admin.roles.add_user_role", role_id=role_id))
+
+
+@roles_bp.route("/delete_users/<int:role_id>", methods=["POST"])
+@login_required
+@admin_required
+def delete_users_from_role(role_id):
+    role = Role.query.get_or_404(role_id)
+    form = BulkRoleUsersForm()
+    if form.validate_on_submit():
+        where = bulk_users(form)
+        if where is None:
+            flash(_("Search or filter the users first"), category="warning")
+            return redirect(url_for("admin.roles.add_user_role", role_id=role_id))
+        if role.name == "admin":
+            # An admin can't lock themselves out with a bulk change.
+            where.append(User.id != current_user.id)
+        removed = role.remove_members(*where)
+        flash(
+            _("%(count)d users removed from the role", count=removed),
+            category="success",
+        )
+    return redirect(url_for("admin.roles.add_user_role", role_id=role_id))
+
+
 @roles_bp.route("/add_user_role/<int:role_id>", methods=["GET", "POST"])
 @login_required
 @admin_required
 def add_user_role(role_id):
     role = Role.query.get_or_404(role_id)
-    return render_template("admin/roles/add_user_role.html", role=role)
+    form = BulkRoleUsersForm()
+    return render_template("admin/roles/add_user_role.html", role=role, form=form)
 
 
 @roles_bp.route("/view/<int:id>", methods=["GET", "POST"])
 @login_required
 @admin_required
+@etag("roles")
 def view_role(id):
     role = Role.query.get_or_404(id)
     return render_template("admin/roles/view.html", role=role)
 
 
+@roles_bp.route("/broadcast/<int:role_id>", methods=["GET", "POST"])
+@login_required
+@admin_required
+def broadcast_role(role_id):
+    role = Role.query.get_or_404(role_id)
+    form = BroadcastForm()
+
+    if form.validate_on_submit():
+        if settings.MAIL_USE_OUTBOX:
+            batch, queued = queue_bulk_email(
+                form.subject.data,
+                settings.MAIL_DEFAULT_SENDER,
+                role.member_emails(),
+                form.body.data,
+                "",
+            )
+            logger.info("Broadcast to role %s: %d emails queued", role.name, queued)
+            if not queued:
+                flash(_("This role has no members"), category="warning")
+                return redirect(url_for("admin.roles.view_role", id=role.id))
+            return redirect(
+                url_for("admin.roles.broadcast_status", role_id=role.id, batch=batch)
+            )
+        sent = 0
+        for emails in role.iter_member_emails(settings.MAIL_MAX_PER_CONNECTION):
+            send_bulk_email(
+                form.subject.data,
+                settings.MAIL_DEFAULT_SENDER,
+                emails,
+                form.body.data,
+                "",
+            )
+            sent += len(emails)
+            logger.info("Broadcast to role %s: %d emails queued", role.name, sent)
+        if not sent:
+            flash(_("This role has no members"), category="warning")
+            return redirect(url_for("admin.roles.view_role", id=role.id))
+        flash(_("Message sent to %(count)d users", count=sent), category="success")
+        return redirect(url_for("admin.roles.view_role", id=role.id))
+
+    return render_template("admin/roles/broadcast.html", form=form, role=role)
+
+
+@roles_bp.route("/broadcast/<int:role_id>/<batch>", methods=["GET"])
+@login_required
+@admin_required
+def broadcast_status(role_id, batch):
+    role = Role.query.get_or_404(role_id)
+    progress = outbox_progress(batch)
+    if not progress:
+        abort(404)
+    return render_template(
+        "admin/roles/broadcast_status.html",
+        role=role,
+        progress=progress,
+        total=sum(progress.values()),
+    )
+
+
 @roles_bp.route("/get_data", methods=["GET"])
 @login_required
 @admin_required
+@etag("roles", "permissions")
 def get_data():
-    query = Role.query
-
-    # search filter
-    search = request.args.get("search[value]")
-    if search:
-        query = query.filter(
-            or_(
-                Role.name.like(f"%{search}%"),
-                Role.permissions.any(Permission.name.like(f"%{search}%")),
-            )
-        )
-    total_filtered = query.count()
-
-    # sorting
-    order = []
-    i = 0
-    while True:
-        col_index = request.args.get(f"order[{i}][column]")
-        if col_index is None:
-            break
-        col_name = request.args.get(f"columns[{col_index}][data]")
-        if col_name not in ["name", "permissions"]:
-            col_name = "name"
-        descending = request.args.get(f"order[{i}][dir]") == "desc"
-        col = getattr(Role, col_name)
-        if descending:
-            col = col.desc()
-        order.append(col)
-        i += 1
-    if order:
-        query = query.order_by(*order)
-
-    # pagination
-    start = request.args.get("start", type=int)
-    length = request.args.get("length", type=int)
-    query = query.offset(start).limit(length)
-
-    # response
-    return {
-        "data": [user.to_dict() for user in query],
-        "recordsFiltered": total_filtered,
-        "recordsTotal": Role.query.count(),
-        "draw": request.args.get("draw", type=int),
-    }
+    return roles_table.draw(request.args)
 
 
 @roles_bp.route("/get_data_users/<int:id>", methods=["GET"])
 @login_required
 @admin_required
+@etag("users", "roles")
 def get_data_users(id):
-    query = User.query.filter(User.roles.any(Role.id == id))
-
-    # search filter
-    search = request.args.get("search[value]")
-    if search:
-        query = query.filter(
-            or_(
-                User.username.like(f"%{search}%"),
-                User.email.like(f"%{search}%"),
-            )
-        )
+    return role_users_table.draw(request.args, [User.roles.any(Role.id == id)])
+
 
-    total_filtered = query.count()
-
-    # sorting
-    order = []
-    i = 0
-    while True:
-        col_index = request.args.get(f"order[{i}][column]")
-        if col_index is None:
-            break
-        col_name = request.args.get(f"columns[{col_index}][data]")
-        if col_name not in ["username", "email"]:
-            col_name = "username"
-        descending = request.args.get(f"order[{i}][dir]") == "desc"
-        col = getattr(User, col_name)
-        if descending:
-            col = col.desc()
-        order.append(col)
-        i += 1
-    if order:
-        query = query.order_by(*order)
-
-    # pagination
-    start = request.args.get("start", type=int)
-    length = request.args.get("length", type=int)
-    query = query.offset(start).limit(length)
-
-    # response
-    return {
-        "data": [user.to_dict() for user in query],
-        "recordsFiltered": total_filtered,
-        "recordsTotal": User.query.count(),
-        "draw": request.args.get("draw", type=int),
-    }
+@roles_bp.route("/export.<any(csv, ndjson):fmt>", methods=["GET"])
+@login_required
+@admin_required
+def export_roles(fmt):
+    return export_response(roles_table, fmt, "roles", request.args)
+
+
+@roles_bp.route("/export_users/<int:id>.<any(csv, ndjson):fmt>", methods=["GET"])
+@login_required
+@admin_required
+def export_role_users(id, fmt):
+    return export_response(
+        role_users_table,
+        fmt,
+        f"role-{id}-users",
+        request.args,
+        [User.roles.any(Role.id == id)],
+    )
@@ -0,0 +1,165 @@
+from datetime import date, datetime, time, timedelta
+from functools import partial
+from typing import List, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from flask_babel import format_datetime
+from sqlalchemy import ARRAY, Integer, and_, any_, func, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.sql import Select
+
+from app import get_timezone
+from app.models import Permission, Role, User, role_permission, user_role
+from app.utils.datatables import Column, DataTable
+
+format_long = partial(format_datetime, format="long")
+
+
+def aggregate_pairs(first, second, *where):
+    """Correlated ``array_agg`` of ``[first, second]`` pairs, ordered by
+    ``first``; ``NULL`` when nothing matches."""
+    return (
+        select(
+            func.array_agg(
+                aggregate_order_by(func.json_build_array(first, second), first)
+            )
+        )
+        .where(*where)
+        .scalar_subquery()
+    )
+
+
+user_roles = aggregate_pairs(
+    Role.id,
+    Role.name,
+    user_role.c.role_id == Role.id,
+    user_role.c.user_id == User.id,
+)
+
+role_permissions = aggregate_pairs(
+    Permission.name,
+    Permission.color,
+    role_permission.c.permission_id == Permission.id,
+    role_permission.c.role_id == Role.id,
+)
+
+
+def any_id(id_column, ids: Select):
+    """``id_column = ANY(ARRAY(ids))``.
+
+    Unlike ``EXISTS`` or ``IN``, this is an index condition on the primary
+    key, so a search OR-ing it with indexed column matches can still use a
+    ``BitmapOr``, or stop early when scanning in the table order.
+    """
+    return id_column == any_(func.array(ids.scalar_subquery(), type_=ARRAY(Integer)))
+
+
+def as_list(value):
+    return value or []
+
+
+def isoformat(value: datetime) -> str:
+    return value.isoformat()
+
+
+def names(pairs, index: int) -> List[str]:
+    return [pair[index] for pair in pairs or []]
+
+
+def parse_date(value: str) -> Optional[date]:
+    value = value.strip()
+    return date.fromisoformat(value) if value else None
+
+
+def created_at_filter(value: str):
+    """Filter ``from,to`` dates, both inclusive and either one optional,
+    as a half-open timestamp range in the user's timezone.
+
+    Malformed values are ignored.
+    """
+    try:
+        start, end = [parse_date(part) for part in value.split(",")]
+    except ValueError:
+        return None
+    if start is None and end is None:
+        return None
+    try:
+        tz = ZoneInfo(get_timezone())
+    except (ValueError, ZoneInfoNotFoundError):
+        tz = ZoneInfo("UTC")
+    clauses = []
+    if start is not None:
+        clauses.append(User.created_at >= datetime.combine(start, time.min, tz))
+    if end is not None and end < date.max:
+        end_exclusive = datetime.combine(end + timedelta(days=1), time.min, tz)
+        clauses.append(User.created_at < end_exclusive)
+    return and_(*clauses)
+
+
+def user_columns(search_roles: bool) -> List[Column]:
+    return [
+        Column("username", User.username, searchable=True, sortable=True),
+        Column("email", User.email, searchable=True, sortable=True),
+        Column(
+            "created_at",
+            User.created_at,
+            filter=created_at_filter,
+            render=format_long,
+            export=isoformat,
+        ),
+        Column(
+            "roles",
+            user_roles,
+            searchable=search_roles,
+            search=lambda pattern: any_id(
+                User.id,
+                select(user_role.c.user_id)
+                .join(Role, Role.id == user_role.c.role_id)
+                .where(Role.name.ilike(pattern)),
+            ),
+            render=as_list,
+            export=partial(names, index=1),
+        ),
+        Column("blocked", User.blocked),
+    ]
+
+
+users_table = DataTable(User, user_columns(search_roles=True), "username", keyset=True)
+
+role_users_table = DataTable(User, user_columns(search_roles=False), "username")
+
+roles_table = DataTable(
+    Role,
+    [
+        Column("name", Role.name, searchable=True, sortable=True),
+        Column("description", Role.description),
+        Column(
+            "permissions",
+            role_permissions,
+            searchable=True,
+            search=lambda pattern: any_id(
+                Role.id,
+                select(role_permission.c.role_id)
+                .join(Permission, Permission.id == role_permission.c.permission_id)
+                .where(Permission.name.ilike(pattern)),
+            ),
+            render=as_list,
+            export=partial(names, index=0),
+        ),
+        Column("created_at", Role.created_at, render=format_long, export=isoformat),
+    ],
+    "name",
+)
+
+permissions_table = DataTable(
+    Permission,
+    [
+        Column("name", Permission.name, searchable=True, sortable=True),
+        Column("description", Permission.description),
+        Column("color", Permission.color),
+        Column(
+            "created_at", Permission.created_at, render=format_long, export=isoformat
+        ),
+    ],
+    "name",
+)
@@ -1,12 +1,13 @@
 from flask import Blueprint, redirect, render_template, request, url_for
 from flask_login import login_required
-from sqlalchemy import and_, func, or_
 
-from app import bcrypt, db
-from app.decorators import admin_required
+from app import db
+from app.decorators import admin_required, etag
 from app.models import Role, User
+from app.utils.export import export_response
 
 from .forms import CreateUserForm, EditUserForm
+from .tables import users_table
 
 users_bp = Blueprint(
     "users",
@@ -31,9 +32,7 @@ def create_user():
     form = CreateUserForm()
 
     if form.validate_on_submit():
-        encrypted_password = bcrypt.generate_password_hash(form.password.data).decode(
-            "utf-8"
-        )
+        encrypted_password = User.generate_password_hash(form.password.data)
         user = User(
             username=form.username.data,
             email=form.email.data,
@@ -87,61 +86,13 @@ def delete_user(id):
 @users_bp.route("/get_data", methods=["GET"])
 @login_required
 @admin_required
+@etag("users", "roles")
 def get_users_data():
-    query = User.query
-
-    # created_at filter
-    created_at_filter = request.args.get("columns[2][search][value]", "")
-
-    if created_at_filter:
-        created_at_filter_from, created_at_filter_to = created_at_filter.split(",")
-        query = query.filter(
-            and_(
-                func.date(User.created_at) >= created_at_filter_from,
-                func.date(User.created_at) <= created_at_filter_to,
-            )
-        )
+    return users_table.draw(request.args)
 
-    # search filter
-    search = request.args.get("search[value]")
-    if search:
-        query = query.filter(
-            or_(
-                User.username.like(f"%{search}%"),
-                User.email.like(f"%{search}%"),
-                User.roles.any(Role.name.like(f"%{search}%")),
-            )
-        )
-    total_filtered = query.count()
-
-    # sorting
-    order = []
-    i = 0
-    while True:
-        col_index = request.args.get(f"order[{i}][column]")
-        if col_index is None:
-            break
-        col_name = request.args.get(f"columns[{col_index}][data]")
-        if col_name not in ["username", "email"]:
-            col_name = "username"
-        descending = request.args.get(f"order[{i}][dir]") == "desc"
-        col = getattr(User, col_name)
-        if descending:
-            col = col.desc()
-        order.append(col)
-        i += 1
-    if order:
-        query = query.order_by(*order)
-
-    # pagination
-    start = request.args.get("start", type=int)
-    length = request.args.get("length", type=int)
-    query = query.offset(start).limit(length)
-
-    # response
-    return {
-        "data": [user.to_dict() for user in query],
-        "recordsFiltered": total_filtered,
-        "recordsTotal": User.query.count(),
-        "draw": request.args.get("draw", type=int),
-    }
+
+@users_bp.route("/export.<any(csv, ndjson):fmt>", methods=["GET"])
+@login_required
+@admin_required
+def export_users(fmt):
+    return export_response(users_table, fmt, "users", request.args)
@@ -2,9 +2,11 @@ from flask import Blueprint, flash, redirect, render_template, request, url_for
 from flask_babel import _
 from flask_login import current_user, login_required, login_user, logout_user
 
+from app import db
 from app.config import settings
+from app.decorators import rate_limit
 from app.models import Role, User
-from app.utils.email import send_email
+from app.utils.email import render_email, send_email
 
 from .forms import (
     LoginForm,
@@ -26,8 +28,6 @@ auth_bp = Blueprint(
 def before_request():
     if current_user.is_authenticated:
         current_user.ping()
-        if current_user.email in settings.ADMIN_EMAIL:
-            current_user.set_admin_role()
         if (
             not current_user.confirmed
             and request.endpoint
@@ -48,6 +48,7 @@ def unconfirmed():
 
 
 @auth_bp.route("/login/", methods=["GET", "POST"])
+@rate_limit("login", settings.RATE_LIMIT_LOGIN, identifier="email")
 def login():
     if current_user.is_authenticated:
         return redirect(url_for("home.home_view"))
@@ -72,21 +73,22 @@ def login():
 
 
 def send_email_confirm(user):
+    """Queue the confirmation email; the caller commits it."""
     token = user.get_confirm_token()
 
-    html_body = render_template(
-        "auth/emails/confirm_account.html", token=token, app_name=settings.SITE_NAME
+    html_body, text_body = render_email(
+        "auth/emails/confirm_account.html", token, app_name=settings.SITE_NAME
     )
-    text_body = ""
     subject = _("Confirm account")
     recipients = [user.email]
-    sender = "noreplay@test.com"
+    sender = settings.MAIL_DEFAULT_SENDER
     send_email(
         subject, sender, recipients, text_body, html_body, attachments=None, sync=False
     )
 
 
 @auth_bp.route("/register/", methods=["GET", "POST"])
+@rate_limit("register", settings.RATE_LIMIT_REGISTER, identifier="email")
 def register():
     if current_user.is_authenticated:
         return redirect(url_for("home.home_view"))
@@ -98,18 +100,21 @@ def register():
             email=form.email.data,
             password=encrypted_password,
         )
-        user.save()
-        role = Role.query.filter_by(name="users").first()
-        user.add_role(role)
+        role_names = ["users"]
         if form.email.data in settings.ADMIN_EMAIL:
-            role = Role.query.filter_by(name="admin").first()
-            user.add_role(role)
+            role_names.append("admin")
+        user.roles = Role.query.filter(Role.name.in_(role_names)).all()
+        db.session.add(user)
+        # The token needs the user id; the user, its roles and the queued
+        # email are then committed together.
+        db.session.flush()
+        send_email_confirm(user)
+        user.save()
         flash(_("Account created succefully"), category="success")
         flash(
             _("Please check your email and confirm your account"),
             category="info",
         )
-        send_email_confirm(user)
         return redirect(url_for("auth.login"))
     return render_template(
         "auth/register.html", form=form, site_name=settings.SITE_NAME
@@ -126,19 +131,20 @@ def logout():
 def send_email_reset_password(user):
     token = user.get_token()
 
-    html_body = render_template(
-        "auth/emails/reset_password.html", token=token, app_name=settings.SITE_NAME
+    html_body, text_body = render_email(
+        "auth/emails/reset_password.html", token, app_name=settings.SITE_NAME
     )
-    text_body = ""
     subject = _("Reset password")
     recipients = [user.email]
-    sender = "noreplay@test.com"
+    sender = settings.MAIL_DEFAULT_SENDER
     send_email(
         subject, sender, recipients, text_body, html_body, attachments=None, sync=False
     )
+    db.session.commit()
 
 
 @auth_bp.route("/reset_password/", methods=["GET", "POST"])
+@rate_limit("reset_password", settings.RATE_LIMIT_RESET_PASSWORD, identifier="email")
 def reset_password():
     form = ResetPasswordRequestForm()
     if form.validate_on_submit():
@@ -158,6 +164,7 @@ def reset_password():
 
 
 @auth_bp.route("/reset_password/<token>", methods=["GET", "POST"])
+@rate_limit("reset_token", settings.RATE_LIMIT_RESET_PASSWORD)
 def reset_token(token):
     user = User.verify_token(token)
     if user is None:
@@ -177,6 +184,7 @@ def reset_token(token):
 
 
 @auth_bp.route("/confirm/<token>", methods=["GET", "POST"])
+@rate_limit("confirm", settings.RATE_LIMIT_CONFIRM, methods=("GET", "POST"))
 @login_required
 def confirm(token):
     if current_user.confirmed:
@@ -193,5 +201,6 @@ def confirm(token):
 @login_required
 def resend_confirmation():
     send_email_confirm(current_user)
+    db.session.commit()
     flash(_("A confirmation email has been sent to you by email"), category="info")
     return redirect(url_for("home.home_view"))
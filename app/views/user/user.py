@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template
 from flask_login import login_required
 
+from app.decorators import etag
 from app.models import User
 
 user_bp = Blueprint(
@@ -14,6 +15,7 @@ user_bp = Blueprint(
 
 @user_bp.route("/<username>", methods=["GET", "POST"])
 @login_required
+@etag("users")
 def user_view(username: str):
     user = User.query.filter_by(username=username).first_or_404()
     return render_template("user/user.html", user=user)
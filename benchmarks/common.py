@@ -0,0 +1,68 @@
+"""Helpers shared by the benchmarks.
+
+Run a benchmark from the repository root with ``python -m benchmarks.<name>``.
+The ones that need Postgres use ``TEST_DATABASE_URL`` like the tests and work
+in a private schema of that database, dropped afterwards.
+"""
+
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Sequence
+
+# Sets the settings the app requires before it is imported.
+from tests.conftest import Database, create_database, drop_database
+
+
+@contextmanager
+def scratch_database() -> Iterator[Database]:
+    """Yield the model tables in a private schema, in an app context."""
+    from sqlalchemy.exc import OperationalError
+    from sqlalchemy.orm import configure_mappers
+
+    from app import app, db
+
+    configure_mappers()
+    with app.app_context():
+        try:
+            database = create_database(db.engine)
+        except OperationalError as e:
+            sys.exit(f"Postgres is not reachable, set TEST_DATABASE_URL: {e.orig}")
+        try:
+            yield database
+        finally:
+            db.session.remove()
+            drop_database(database)
+
+
+def measure(fn: Callable[[], object], repeat: int) -> List[float]:
+    """Call ``fn`` ``repeat`` times and return each duration in ms."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def percentile(samples: Sequence[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summary(samples: Sequence[float]) -> List[str]:
+    """Median and p95 of ``samples``, formatted in ms."""
+    return [
+        f"{statistics.median(samples):.2f}",
+        f"{percentile(samples, 0.95):.2f}",
+    ]
+
+
+def print_table(headers: Sequence[str], rows: Sequence[Sequence[object]]) -> None:
+    cells = [list(map(str, headers))] + [list(map(str, row)) for row in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(headers))]
+    for i, row in enumerate(cells):
+        print("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
+        if i == 0:
+            print("  ".join("-" * width for width in widths))
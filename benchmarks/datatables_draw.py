@@ -0,0 +1,182 @@
+"""Per-draw latency of the DataTables engine.
+
+Times the users table draw against the per-endpoint code it replaced
+(ORM rows, ``to_dict()`` with lazy-loaded roles, and two ``count()`` per
+draw), then the engine draw of the other admin tables.
+
+    TEST_DATABASE_URL=postgresql://... python -m benchmarks.datatables_draw
+"""
+
+import argparse
+
+from sqlalchemy import and_, func, or_, text
+
+from benchmarks.common import measure, print_table, scratch_database, summary
+from tests.conftest import analyze, seed_roles, seed_users
+
+SCENARIOS = {
+    "first page": {},
+    "page 100": {"start": "990"},
+    "sort by email desc": {
+        "columns[1][data]": "email",
+        "order[0][column]": "1",
+        "order[0][dir]": "desc",
+    },
+    "search": {"search[value]": "user12"},
+}
+
+
+def legacy_draw():
+    """The users endpoint before the engine, from the baseline revision."""
+    from flask import request
+
+    from app.models import Role, User
+
+    query = User.query
+    created_at_filter = request.args.get("columns[2][search][value]", "")
+    if created_at_filter:
+        created_at_from, created_at_to = created_at_filter.split(",")
+        query = query.filter(
+            and_(
+                func.date(User.created_at) >= created_at_from,
+                func.date(User.created_at) <= created_at_to,
+            )
+        )
+    search = request.args.get("search[value]")
+    if search:
+        query = query.filter(
+            or_(
+                User.username.like(f"%{search}%"),
+                User.email.like(f"%{search}%"),
+                User.roles.any(Role.name.like(f"%{search}%")),
+            )
+        )
+    total_filtered = query.count()
+    order = []
+    i = 0
+    while True:
+        col_index = request.args.get(f"order[{i}][column]")
+        if col_index is None:
+            break
+        col_name = request.args.get(f"columns[{col_index}][data]")
+        if col_name not in ["username", "email"]:
+            col_name = "username"
+        col = getattr(User, col_name)
+        if request.args.get(f"order[{i}][dir]") == "desc":
+            col = col.desc()
+        order.append(col)
+        i += 1
+    if order:
+        query = query.order_by(*order)
+    query = query.offset(request.args.get("start", type=int)).limit(
+        request.args.get("length", type=int)
+    )
+    return {
+        "data": [user.to_dict() for user in query],
+        "recordsFiltered": total_filtered,
+        "recordsTotal": User.query.count(),
+        "draw": request.args.get("draw", type=int),
+    }
+
+
+def seed(session, users: int, roles: int) -> None:
+    seed_users(session, users)
+    seed_roles(session, roles)
+    session.execute(
+        text(
+            "INSERT INTO permissions (name, description, color) "
+            "SELECT 'perm' || g, 'Permission ' || g, '#ffffff' "
+            "FROM generate_series(1, :roles) g"
+        ),
+        {"roles": roles},
+    )
+    # Every user in two roles, every role with three permissions.
+    session.execute(
+        text(
+            "INSERT INTO user_role "
+            "SELECT users.id, (users.id + k) % :roles + 1 "
+            "FROM users, generate_series(0, 1) k"
+        ),
+        {"roles": roles},
+    )
+    session.execute(
+        text(
+            "INSERT INTO role_permission "
+            "SELECT roles.id, (roles.id + k) % :roles + 1 "
+            "FROM roles, generate_series(0, 2) k"
+        ),
+        {"roles": roles},
+    )
+    analyze(session)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--roles", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    from app import app, db
+    from app.views.admin.tables import (
+        permissions_table,
+        role_users_table,
+        roles_table,
+        users_table,
+    )
+
+    def timed(draw, query):
+        base = {"draw": "1", "start": "0", "length": "10", "columns[0][data]": ""}
+
+        def run():
+            with app.test_request_context(query_string={**base, **query}):
+                from flask import request
+
+                draw(request.args)
+                db.session.remove()
+
+        run()  # warm the statement and count caches
+        return summary(measure(run, args.repeat))
+
+    with scratch_database() as database:
+        seed(db.session, args.users, args.roles)
+        print(
+            f"{args.users} users, {args.roles} roles, {args.repeat} draws each, "
+            f"trigram indexes: {'yes' if database.trgm else 'no'}\n"
+        )
+
+        rows = []
+        for name, query in SCENARIOS.items():
+            legacy = timed(lambda _: legacy_draw(), query)
+            engine = timed(users_table.draw, query)
+            rows.append([name, *legacy, *engine])
+        print_table(
+            [
+                "users draw",
+                "before median ms",
+                "before p95 ms",
+                "engine median ms",
+                "engine p95 ms",
+            ],
+            rows,
+        )
+        print()
+
+        from app.models import Role, User
+
+        rows = [
+            ["roles", *timed(roles_table.draw, {})],
+            ["permissions", *timed(permissions_table.draw, {})],
+            [
+                "role members",
+                *timed(
+                    lambda a: role_users_table.draw(a, [User.roles.any(Role.id == 1)]),
+                    {},
+                ),
+            ],
+        ]
+        print_table(["engine draw", "median ms", "p95 ms"], rows)
+
+
+if __name__ == "__main__":
+    main()
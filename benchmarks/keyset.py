@@ -0,0 +1,82 @@
+"""Latency of the users table draw by page, keyset versus OFFSET.
+
+Each page is drawn twice: by offset alone, as when the client jumps to an
+arbitrary page, and with the cursor of the previous page's last row, as
+when it pages forward. Both must return the same rows.
+
+    TEST_DATABASE_URL=postgresql://... python -m benchmarks.keyset
+"""
+
+import argparse
+
+from sqlalchemy import select
+
+from benchmarks.common import measure, print_table, scratch_database, summary
+from tests.conftest import analyze, seed_users
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--length", type=int, default=10)
+    parser.add_argument(
+        "--pages", type=int, nargs="+", default=[1, 10, 100, 1000, 10000]
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    from flask import request
+
+    from app import app, db
+    from app.models import User
+    from app.utils.datatables import encode_cursor
+    from app.views.admin.tables import users_table
+
+    def draw(query):
+        with app.test_request_context(query_string=query):
+            response = users_table.draw(request.args)
+            db.session.remove()
+        return [row["id"] for row in response["data"]]
+
+    with scratch_database():
+        seed_users(db.session, args.users)
+        analyze(db.session)
+        print(f"{args.users} users, {args.length} rows per page\n")
+
+        rows = []
+        for page in args.pages:
+            start = (page - 1) * args.length
+            offset = {"start": str(start), "length": str(args.length)}
+            keyset = dict(offset)
+            if start:
+                # The last row of the previous page, as the client keeps it.
+                username, id = db.session.execute(
+                    select(User.username, User.id)
+                    .order_by(User.username, User.id)
+                    .offset(start - 1)
+                    .limit(1)
+                ).one()
+                keyset["cursor"] = encode_cursor(username, id)
+                db.session.remove()
+            assert draw(offset) == draw(keyset), f"page {page} differs"
+            rows.append(
+                [
+                    page,
+                    *summary(measure(lambda: draw(offset), args.repeat)),
+                    *summary(measure(lambda: draw(keyset), args.repeat)),
+                ]
+            )
+        print_table(
+            [
+                "page",
+                "offset median ms",
+                "offset p95 ms",
+                "keyset median ms",
+                "keyset p95 ms",
+            ],
+            rows,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Database writes of the last_seen ping, per request versus write-behind.
+
+Replays ``--requests`` requests from ``--users`` active users. Each request
+loads its user, as Flask-Login does, then pings it: before, with an UPDATE
+and a commit of its own; after, through ``User.ping`` and the write-behind
+buffer, flushed once at the end.
+
+    TEST_DATABASE_URL=postgresql://... python -m benchmarks.last_seen
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime
+
+from sqlalchemy import event, text
+
+from benchmarks.common import print_table, scratch_database
+from tests.conftest import analyze, seed_users
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--active", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    from app import db
+    from app.models import User
+    from app.utils.presence import last_seen_writer
+
+    def legacy_ping(user: User) -> None:
+        user.last_seen = datetime.utcnow()
+        user.updated_at = datetime.utcnow()
+        db.session.commit()
+
+    def ping(user: User) -> None:
+        user.ping()
+
+    with scratch_database():
+        seed_users(db.session, args.users)
+        analyze(db.session)
+        print(
+            f"{args.requests} requests from {args.active} of {args.users} users, "
+            f"granularity {last_seen_writer.granularity}\n"
+        )
+
+        counts = {"updates": 0, "commits": 0}
+
+        @event.listens_for(db.engine, "before_cursor_execute")
+        def count_update(conn, cursor, statement, parameters, context, executemany):
+            counts["updates"] += statement.startswith("UPDATE users")
+
+        @event.listens_for(db.engine, "commit")
+        def count_commit(conn):
+            counts["commits"] += 1
+
+        rows = []
+        for name, fn in [("per request", legacy_ping), ("write-behind", ping)]:
+            # Everyone was last seen long ago, so the first ping of each writes.
+            db.session.execute(text("UPDATE users SET last_seen = '2020-01-01'"))
+            db.session.commit()
+            rng = random.Random(0)
+            counts.update(updates=0, commits=0)
+            start = time.perf_counter()
+            for _ in range(args.requests):
+                fn(db.session.get(User, rng.randint(1, args.active)))
+                db.session.remove()
+            last_seen_writer.flush()
+            elapsed = time.perf_counter() - start
+            rows.append(
+                [
+                    name,
+                    counts["updates"],
+                    counts["commits"],
+                    f"{counts['updates'] / elapsed:.0f}",
+                    f"{args.requests / elapsed:.0f}",
+                ]
+            )
+        print_table(
+            ["ping", "UPDATEs", "commits", "UPDATEs/s", "requests/s"],
+            rows,
+        )
+
+
+if __name__ == "__main__":
+    main()
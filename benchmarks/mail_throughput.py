@@ -0,0 +1,128 @@
+"""Mail throughput, a thread per message versus the dispatcher pool.
+
+Sends ``--messages`` messages to a local aiosmtpd server, which can be made
+to take ``--delay-ms`` per message like a remote relay. Before, each message
+had a thread and an SMTP connection of its own; after, ``MailDispatcher``
+reuses a few connections. Needs ``pip install aiosmtpd``.
+
+    python -m benchmarks.mail_throughput
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import time
+from threading import Lock, Thread
+
+from benchmarks.common import print_table
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--delay-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    from aiosmtpd.controller import Controller
+    from aiosmtpd.smtp import SMTP
+
+    counts = {"connections": 0, "messages": 0}
+    lock = Lock()
+
+    class Handler:
+        async def handle_DATA(self, server, session, envelope):
+            await asyncio.sleep(args.delay_ms / 1000)
+            with lock:
+                counts["messages"] += 1
+            return "250 OK"
+
+    class CountingSMTP(SMTP):
+        def connection_made(self, transport):
+            with lock:
+                counts["connections"] += 1
+            super().connection_made(transport)
+
+    class CountingController(Controller):
+        def factory(self):
+            return CountingSMTP(self.handler, **self.SMTP_kwargs)
+
+    port = free_port()
+    # The mail settings are read when the app is imported. MAIL_USE_TLS is
+    # a string, so only an empty one turns STARTTLS off.
+    os.environ.update(MAIL_SERVER="127.0.0.1", MAIL_PORT=str(port), MAIL_USE_TLS="")
+
+    from flask_mail import Message
+
+    from app import app, mail
+    from app.config import settings
+    from app.utils.email import MailDispatcher
+
+    def message(i: int) -> Message:
+        msg = Message("Benchmark", sender="noreply@example.com")
+        msg.recipients = [f"user{i}@example.com"]
+        msg.body = "Hello"
+        return msg
+
+    def legacy_send(msg: Message) -> None:
+        with app.app_context():
+            mail.send(msg)
+
+    def thread_per_message() -> None:
+        threads = [
+            Thread(target=legacy_send, args=(message(i),)) for i in range(args.messages)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def dispatcher() -> None:
+        pool = MailDispatcher(
+            senders=settings.MAIL_SENDERS,
+            queue_size=args.messages,
+            max_per_connection=settings.MAIL_MAX_PER_CONNECTION,
+            idle_timeout=settings.MAIL_IDLE_TIMEOUT,
+            max_retries=settings.MAIL_MAX_RETRIES,
+        )
+        for i in range(args.messages):
+            pool.submit(message(i))
+        pool.stop()
+
+    controller = CountingController(Handler(), hostname="127.0.0.1", port=port)
+    controller.start()
+    print(
+        f"{args.messages} messages, {args.delay_ms}ms per message at the server, "
+        f"{settings.MAIL_SENDERS} dispatcher senders\n"
+    )
+    rows = []
+    try:
+        for name, fn in [
+            ("thread per message", thread_per_message),
+            ("dispatcher", dispatcher),
+        ]:
+            counts.update(connections=0, messages=0)
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+            rows.append(
+                [
+                    name,
+                    counts["messages"],
+                    counts["connections"],
+                    f"{counts['messages'] / elapsed:.0f}",
+                ]
+            )
+    finally:
+        controller.stop()
+    print_table(["sender", "delivered", "connections", "messages/s"], rows)
+
+
+if __name__ == "__main__":
+    main()
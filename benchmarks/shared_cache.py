@@ -0,0 +1,108 @@
+"""Hit rate, staleness and latency of the cache across worker processes.
+
+Forks ``--workers`` processes, as gunicorn does, that read keys with a
+skewed popularity. A miss costs ``--miss-ms`` to recompute and is stored.
+A small share of requests change a key's source value and delete the key
+from the cache, as a role change does. A read returning an older value
+than the source counts as stale.
+
+    python -m benchmarks.shared_cache
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from flask_caching.backends.simplecache import SimpleCache
+
+from benchmarks.common import percentile, print_table
+
+
+def worker(cache, versions, args, seed, results) -> None:
+    rng = random.Random(seed)
+    hits = stale = 0
+    latencies = []
+    for _ in range(args.requests):
+        # Zipf-like popularity: a few keys take most of the reads.
+        key = int(args.keys * rng.random() ** 3)
+        if rng.random() < args.invalidate:
+            with versions.get_lock():
+                versions[key] += 1
+            cache.delete(f"key:{key}")
+            continue
+        start = time.perf_counter()
+        value = cache.get(f"key:{key}")
+        latencies.append((time.perf_counter() - start) * 1e6)
+        if value is None:
+            time.sleep(args.miss_ms / 1000)
+            cache.set(f"key:{key}", versions[key])
+        else:
+            hits += 1
+            stale += value != versions[key]
+    results.put((hits, stale, latencies))
+
+
+def run(make_cache, args):
+    context = multiprocessing.get_context("fork")
+    versions = context.Array("i", args.keys)
+    results = context.Queue()
+    cache = make_cache()
+    start = time.perf_counter()
+    processes = [
+        context.Process(target=worker, args=(cache, versions, args, i, results))
+        for i in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+
+    reads = sum(len(latencies) for _, _, latencies in outcomes)
+    hits = sum(hits for hits, _, _ in outcomes)
+    stale = sum(stale for _, stale, _ in outcomes)
+    latencies = [value for _, _, values in outcomes for value in values]
+    return [
+        f"{100 * hits / reads:.1f}",
+        f"{100 * stale / max(hits, 1):.2f}",
+        f"{statistics.median(latencies):.0f}",
+        f"{percentile(latencies, 0.95):.0f}",
+        f"{args.workers * args.requests / elapsed:.0f}",
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--keys", type=int, default=2000)
+    parser.add_argument("--invalidate", type=float, default=0.01)
+    parser.add_argument("--miss-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    from app.utils.sqlite_cache import SQLiteCache
+
+    print(
+        f"{args.workers} workers, {args.requests} requests each, {args.keys} keys, "
+        f"{args.invalidate:.0%} invalidations, {args.miss_ms}ms per miss\n"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        backends = {
+            "SimpleCache": lambda: SimpleCache(threshold=10000, default_timeout=300),
+            "SQLiteCache": lambda: SQLiteCache(
+                os.path.join(directory, "cache.sqlite"), threshold=10000
+            ),
+        }
+        rows = [[name, *run(make_cache, args)] for name, make_cache in backends.items()]
+    print_table(
+        ["backend", "hit %", "stale %", "get p50 us", "get p95 us", "requests/s"], rows
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+from app.config import settings
+
+
+def on_starting(server):
+    # Runs once in the master, so workers never race on the admin grants.
+    if settings.ADMIN_SYNC_ON_STARTUP:
+        from app.commands import sync_admins_on_startup
+
+        sync_admins_on_startup()
@@ -0,0 +1,217 @@
+import os
+import tempfile
+import uuid
+from contextlib import contextmanager
+from typing import Iterator, List
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.exc import DBAPIError, OperationalError
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+# Settings the app requires at import time, so the suite can be collected
+# without a .env file. TEST_DATABASE_URL selects the Postgres server to test
+# against; every test run works in its own schema, dropped afterwards.
+for name, value in {
+    "SECRET_KEY": "test",
+    "ADMIN_EMAIL": '["admin@example.com"]',
+    "SITE_NAME": "Test",
+    "MAIL_SERVER": "localhost",
+    "MAIL_PORT": "25",
+    "MAIL_USE_TLS": "False",
+    "MAIL_USERNAME": "",
+    "MAIL_PASSWORD": "",
+    "POSTGRES_HOSTNAME": "localhost",
+    "POSTGRES_PORT": "5432",
+    "POSTGRES_USER": "postgres",
+    "POSTGRES_PASSWORD": "postgres",
+    "POSTGRES_DB": "postgres",
+    "ADMIN_SYNC_ON_STARTUP": "False",
+}.items():
+    os.environ.setdefault(name, value)
+if os.environ.get("TEST_DATABASE_URL"):
+    os.environ["SQLALCHEMY_DATABASE_URI"] = os.environ["TEST_DATABASE_URL"]
+os.environ["CACHE_SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(), "cache.sqlite")
+
+
+class Database:
+    def __init__(self, engine, schema: str, trgm: bool, on_connect) -> None:
+        self.engine = engine
+        self.schema = schema
+        self.trgm = trgm
+        self.on_connect = on_connect
+
+
+def is_trgm(index) -> bool:
+    ops = index.dialect_options["postgresql"]["ops"] or {}
+    return "gin_trgm_ops" in ops.values()
+
+
+def create_trgm(engine) -> bool:
+    try:
+        with engine.begin() as connection:
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    except DBAPIError:
+        return False
+    return True
+
+
+def create_database(engine) -> Database:
+    """Create the model tables in a new private schema and point every new
+    connection of ``engine`` at it.
+
+    Raises ``OperationalError`` when the database is not reachable.
+    """
+    from app import db
+
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+    with engine.begin() as connection:
+        connection.execute(text(f"CREATE SCHEMA {schema}"))
+    trgm = create_trgm(engine)
+
+    def set_search_path(dbapi_connection, record) -> None:
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"SET search_path TO {schema}, public")
+        cursor.close()
+        dbapi_connection.commit()
+
+    event.listen(engine, "connect", set_search_path)
+    engine.dispose()
+    database = Database(engine, schema, trgm, set_search_path)
+    try:
+        with engine.begin() as connection:
+            for table in db.metadata.sorted_tables:
+                connection.execute(CreateTable(table))
+                for index in table.indexes:
+                    # Without pg_trgm the trigram indexes are left out; the
+                    # tests that need them skip.
+                    if trgm or not is_trgm(index):
+                        connection.execute(CreateIndex(index))
+    except BaseException:
+        drop_database(database)
+        raise
+    return database
+
+
+def drop_database(database: Database) -> None:
+    event.remove(database.engine, "connect", database.on_connect)
+    database.engine.dispose()
+    with database.engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA {database.schema} CASCADE"))
+
+
+@pytest.fixture(scope="session")
+def flask_app():
+    from sqlalchemy.orm import configure_mappers
+
+    from app import app
+
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    # Table columns refer to relationships before any query configures them.
+    configure_mappers()
+    return app
+
+
+@pytest.fixture(scope="session")
+def database(flask_app) -> Iterator[Database]:
+    """Create the model tables in a private schema of the test database, or
+    skip the test when no database is reachable."""
+    from app import db
+
+    with flask_app.app_context():
+        try:
+            database = create_database(db.engine)
+        except OperationalError as e:
+            pytest.skip(f"Postgres is not reachable: {e.orig}")
+        try:
+            yield database
+        finally:
+            db.session.remove()
+            drop_database(database)
+
+
+@pytest.fixture
+def session(database, flask_app):
+    """The app's session in an app context; every table and the cache are
+    emptied after the test."""
+    from app import cache, db
+
+    with flask_app.app_context():
+        yield db.session
+        db.session.rollback()
+        tables = ", ".join(table.name for table in db.metadata.sorted_tables)
+        db.session.execute(text(f"TRUNCATE {tables} RESTART IDENTITY CASCADE"))
+        db.session.commit()
+        db.session.remove()
+        cache.clear()
+
+
+@contextmanager
+def count_queries(engine) -> Iterator[List[str]]:
+    """Collect the SQL statements run on ``engine`` inside the block."""
+    statements: List[str] = []
+
+    def before_cursor_execute(conn, cursor, statement, *args) -> None:
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture
+def assert_num_queries(database):
+    """Assert that the block runs exactly ``expected`` statements."""
+
+    @contextmanager
+    def assert_num_queries(expected: int) -> Iterator[List[str]]:
+        with count_queries(database.engine) as statements:
+            yield statements
+        assert len(statements) == expected, "\n\n".join(statements)
+
+    return assert_num_queries
+
+
+@pytest.fixture
+def explain(session):
+    """Return the text of the plan Postgres picks for a statement."""
+
+    def explain(stmt) -> str:
+        connection = session.connection()
+        compiled = stmt.compile(dialect=connection.dialect)
+        rows = connection.exec_driver_sql(f"EXPLAIN {compiled}", compiled.params)
+        return "\n".join(row[0] for row in rows)
+
+    return explain
+
+
+def seed_users(session, count: int, prefix: str = "user") -> None:
+    session.execute(
+        text(
+            "INSERT INTO users (username, email, password, blocked, confirmed, "
+            "locale, created_at) "
+            "SELECT :prefix || g, :prefix || g || '@example.com', 'x', false, true, "
+            "'en', timestamp '2020-01-01' + g * interval '1 hour' "
+            "FROM generate_series(1, :count) g"
+        ),
+        {"prefix": prefix, "count": count},
+    )
+
+
+def seed_roles(session, count: int) -> None:
+    session.execute(
+        text(
+            "INSERT INTO roles (name, description) "
+            "SELECT 'role' || g, 'Role ' || g FROM generate_series(1, :count) g"
+        ),
+        {"count": count},
+    )
+
+
+def analyze(session) -> None:
+    session.commit()
+    session.execute(text("ANALYZE"))
+    # The statistics are rolled back with the transaction otherwise.
+    session.commit()
@@ -0,0 +1,93 @@
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.exc import IntegrityError
+
+from .conftest import analyze, seed_roles, seed_users
+
+
+@pytest.fixture
+def seeded(session):
+    # 20000 users in two of 500 roles each, 500 roles with three of 300
+    # permissions each: every lookup matches a small slice of the table.
+    seed_users(session, 20000)
+    seed_roles(session, 500)
+    session.execute(
+        text(
+            "INSERT INTO permissions (name, description, color) "
+            "SELECT 'perm' || g, 'Permission ' || g, '#ffffff' "
+            "FROM generate_series(1, 300) g"
+        )
+    )
+    session.execute(
+        text(
+            "INSERT INTO user_role (user_id, role_id) "
+            "SELECT users.id, (users.id + k * 7) % 500 + 1 "
+            "FROM users, generate_series(0, 1) k"
+        )
+    )
+    session.execute(
+        text(
+            "INSERT INTO role_permission (role_id, permission_id) "
+            "SELECT roles.id, (roles.id + k * 11) % 300 + 1 "
+            "FROM roles, generate_series(0, 2) k"
+        )
+    )
+    analyze(session)
+
+
+def test_role_members_use_reverse_index(seeded, explain):
+    from app.models import user_role
+
+    plan = explain(select(user_role.c.user_id).where(user_role.c.role_id == 42))
+    assert "ix_user_role_role_id_user_id" in plan
+    assert "Seq Scan" not in plan
+
+
+def test_member_emails_use_reverse_index(seeded, explain):
+    from app.models import Role
+
+    plan = explain(Role(id=42).member_emails())
+    assert "ix_user_role_role_id_user_id" in plan
+    assert "Seq Scan on user_role" not in plan
+
+
+def test_user_roles_use_primary_key(seeded, explain):
+    from app.models import user_role
+
+    plan = explain(select(user_role.c.role_id).where(user_role.c.user_id == 42))
+    assert "user_role_pkey" in plan
+    assert "Seq Scan" not in plan
+
+
+def test_users_with_role_use_reverse_index(seeded, explain):
+    from app.models import Role, User
+
+    plan = explain(select(User.id).where(User.roles.any(Role.id == 42)))
+    assert "ix_user_role_role_id_user_id" in plan
+    assert "Seq Scan on user_role" not in plan
+
+
+def test_permission_roles_use_reverse_index(seeded, explain):
+    from app.models import role_permission
+
+    plan = explain(
+        select(role_permission.c.role_id).where(role_permission.c.permission_id == 42)
+    )
+    assert "ix_role_permission_permission_id_role_id" in plan
+    assert "Seq Scan" not in plan
+
+
+def test_role_permissions_use_primary_key(seeded, explain):
+    from app.models import role_permission
+
+    plan = explain(
+        select(role_permission.c.permission_id).where(role_permission.c.role_id == 42)
+    )
+    assert "role_permission_pkey" in plan
+    assert "Seq Scan" not in plan
+
+
+def test_duplicate_grant_is_rejected(seeded, session):
+    # The seed already puts user 1 in roles 2 and 9.
+    with pytest.raises(IntegrityError):
+        session.execute(text("INSERT INTO user_role (user_id, role_id) VALUES (1, 9)"))
@@ -0,0 +1,46 @@
+import pytest
+from sqlalchemy import select
+
+from .conftest import analyze, seed_users
+
+
+@pytest.mark.parametrize("value", ["", ",", "garbage", "2020-01-05", "1,2,3"])
+def test_malformed_or_empty_range_is_ignored(flask_app, value):
+    from app.views.admin.tables import created_at_filter
+
+    with flask_app.test_request_context():
+        assert created_at_filter(value) is None
+
+
+def test_range_uses_created_at_index(session, flask_app, explain):
+    from app.models import User
+    from app.views.admin.tables import created_at_filter
+
+    seed_users(session, 20000)
+    analyze(session)
+
+    with flask_app.test_request_context():
+        clause = created_at_filter("2020-01-05,2020-01-06")
+    plan = explain(select(User.id).where(clause))
+
+    assert "ix_users_created_at" in plan
+    assert "created_at >=" in plan
+    assert "created_at <" in plan
+    assert "Seq Scan" not in plan
+    assert len(session.execute(select(User.id).where(clause)).all()) == 48
+
+
+def test_open_ended_range_keeps_one_bound(session, flask_app, explain):
+    from app.models import User
+    from app.views.admin.tables import created_at_filter
+
+    seed_users(session, 20000)
+    analyze(session)
+
+    with flask_app.test_request_context():
+        clause = created_at_filter(",2020-01-02")
+    plan = explain(select(User.id).where(clause))
+
+    assert "ix_users_created_at" in plan
+    assert "created_at >=" not in plan
+    assert len(session.execute(select(User.id).where(clause)).all()) == 47
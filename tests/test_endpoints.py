@@ -0,0 +1,123 @@
+import pytest
+from sqlalchemy import text
+
+from .conftest import seed_roles, seed_users
+
+# (users, roles): the query count of each page must not grow with them.
+SIZES = [(5, 2), (50, 20)]
+
+# Queries per request once the grant, user and count caches are warm.
+ENDPOINTS = [
+    # the roles, then all member counts in one GROUP BY
+    ("/admin/roles/", 2),
+    # the role; its members load through get_data_users
+    ("/admin/roles/view/1", 1),
+    # roles with their permissions aggregated in one SELECT
+    ("/admin/roles/get_data?draw=1&start=0&length=100", 1),
+    # the member count, then members with their roles in one SELECT
+    ("/admin/roles/get_data_users/1?draw=1&start=0&length=100", 2),
+    ("/admin/permissions/get_data?draw=1&start=0&length=100", 1),
+    ("/user/user2", 1),
+]
+
+
+def seed(session, users: int, roles: int) -> None:
+    """Put every user in every role with every permission, and make user1
+    an admin."""
+    seed_users(session, users)
+    seed_roles(session, roles)
+    session.execute(
+        text(
+            "INSERT INTO permissions (name, description, color) "
+            "SELECT 'perm' || g, 'Permission ' || g, '#ffffff' "
+            "FROM generate_series(1, :roles) g"
+        ),
+        {"roles": roles},
+    )
+    session.execute(
+        text("INSERT INTO user_role SELECT users.id, roles.id FROM users, roles")
+    )
+    session.execute(
+        text(
+            "INSERT INTO role_permission "
+            "SELECT roles.id, permissions.id FROM roles, permissions"
+        )
+    )
+    session.execute(
+        text("INSERT INTO roles (name, description) VALUES ('admin', 'Admin')")
+    )
+    session.execute(
+        text(
+            "INSERT INTO user_role SELECT users.id, roles.id FROM users, roles "
+            "WHERE users.username = 'user1' AND roles.name = 'admin'"
+        )
+    )
+    session.commit()
+
+
+@pytest.fixture
+def client(flask_app, session):
+    """A test client logged in as user1."""
+    client = flask_app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session["_user_id"] = "1"
+        flask_session["_fresh"] = True
+    return client
+
+
+@pytest.mark.parametrize("users, roles", SIZES)
+@pytest.mark.parametrize("url, expected", ENDPOINTS)
+def test_endpoint_query_count(
+    client, session, assert_num_queries, url, expected, users, roles
+):
+    seed(session, users, roles)
+    assert client.get(url).status_code == 200  # warm the caches
+
+    with assert_num_queries(expected):
+        response = client.get(url)
+    assert response.status_code == 200
+
+
+def test_theme_change_invalidates_etag(client, session):
+    seed(session, 5, 2)
+    response = client.get("/admin/roles/")
+    etag = response.headers["ETag"]
+    response = client.get("/admin/roles/", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    client.post("/set_theme/dark")
+    response = client.get("/admin/roles/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert 'data-bs-theme="dark"' in response.get_data(as_text=True)
+
+
+@pytest.mark.parametrize("value, status", [("user3", 200), (3, 400), (True, 400)])
+def test_cursor_value_must_match_sort_column(client, session, value, status):
+    from app.utils.datatables import encode_cursor
+
+    seed(session, 5, 2)
+    url = f"/admin/users/get_data?start=10&length=10&cursor={encode_cursor(value, 3)}"
+    assert client.get(url).status_code == status
+
+
+def test_bulk_matching_needs_a_search(client, session):
+    seed(session, 5, 2)
+
+    response = client.post("/admin/roles/delete_users/1", data={"scope": "matching"})
+    assert response.status_code == 302
+    members = session.execute(text("SELECT count(*) FROM user_role WHERE role_id = 1"))
+    assert members.scalar_one() == 5
+
+
+def test_bulk_removal_keeps_the_acting_admin(client, session):
+    seed(session, 5, 2)
+    session.execute(text("INSERT INTO user_role VALUES (2, 3)"))
+    session.commit()
+
+    response = client.post(
+        "/admin/roles/delete_users/3?search[value]=user",
+        data={"scope": "matching"},
+    )
+    assert response.status_code == 302
+    admins = session.execute(text("SELECT user_id FROM user_role WHERE role_id = 3"))
+    assert admins.scalars().all() == [1]
@@ -0,0 +1,108 @@
+import pytest
+from sqlalchemy import text
+from werkzeug.datastructures import MultiDict
+
+from .conftest import seed_roles, seed_users
+
+
+def grant_roles(session, username: str, roles: int) -> None:
+    session.execute(
+        text(
+            "INSERT INTO user_role (user_id, role_id) "
+            "SELECT users.id, roles.id FROM users, roles "
+            "WHERE users.username = :username AND roles.id <= :roles"
+        ),
+        {"username": username, "roles": roles},
+    )
+    session.execute(
+        text(
+            "INSERT INTO permissions (name, description, color) "
+            "SELECT 'perm' || g, 'Permission ' || g, '#ffffff' "
+            "FROM generate_series(1, 3) g"
+        )
+    )
+    session.execute(
+        text(
+            "INSERT INTO role_permission (role_id, permission_id) "
+            "SELECT roles.id, permissions.id FROM roles, permissions"
+        )
+    )
+    session.commit()
+
+
+@pytest.mark.parametrize("roles", [1, 10])
+def test_grants_load_in_two_queries(session, assert_num_queries, roles):
+    from app.models import User
+
+    seed_users(session, 1)
+    seed_roles(session, 10)
+    grant_roles(session, "user1", roles)
+    user = User.query.filter_by(username="user1").one()
+
+    with assert_num_queries(2):
+        loaded = user.roles_with_permissions()
+        assert sum(len(role.permissions) for role in loaded) == roles * 3
+
+
+def test_member_counts_in_one_query(session, assert_num_queries):
+    from app.models import Role
+
+    seed_users(session, 20)
+    seed_roles(session, 5)
+    session.execute(
+        text(
+            "INSERT INTO user_role (user_id, role_id) "
+            "SELECT users.id, roles.id FROM users, roles WHERE users.id % roles.id = 0"
+        )
+    )
+    session.commit()
+
+    with assert_num_queries(1):
+        counts = Role.member_counts()
+    assert counts == {role: 20 // role for role in range(1, 6)}
+
+
+@pytest.mark.parametrize("admins", [1, 5])
+def test_sync_admin_roles_query_count(session, flask_app, assert_num_queries, admins):
+    from app.config import settings
+    from app.models import User
+
+    seed_users(session, admins, prefix="admin")
+    session.execute(
+        text("INSERT INTO roles (name, description) VALUES ('admin', 'Admin')")
+    )
+    session.commit()
+    emails = [f"admin{i}@example.com" for i in range(1, admins + 1)]
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(settings, "ADMIN_EMAIL", emails)
+        # The role, the users, their roles in one selectinload, then one
+        # UPDATE and one INSERT for all of them.
+        with assert_num_queries(5):
+            assert User.sync_admin_roles() == admins
+    assert all(user.is_admin() for user in User.query.all())
+
+
+def test_datatables_query_count_does_not_depend_on_page_size(
+    session, flask_app, database
+):
+    from app.views.admin.tables import users_table
+
+    from .conftest import count_queries
+
+    seed_users(session, 200)
+    seed_roles(session, 3)
+    session.execute(
+        text("INSERT INTO user_role SELECT users.id, roles.id FROM users, roles")
+    )
+    session.commit()
+
+    def draw(length: int) -> int:
+        args = MultiDict({"start": "0", "length": str(length)})
+        with flask_app.test_request_context():
+            users_table.draw(args)  # warm the count cache
+            with count_queries(database.engine) as statements:
+                assert len(users_table.draw(args)["data"]) == length
+        return len(statements)
+
+    assert draw(10) == draw(100)
@@ -0,0 +1,66 @@
+import pytest
+from sqlalchemy import text
+from werkzeug.datastructures import MultiDict
+
+from .conftest import analyze, seed_roles, seed_users
+
+
+@pytest.fixture
+def trgm(database):
+    if not database.trgm:
+        pytest.skip("pg_trgm is not available on the test database")
+
+
+@pytest.fixture
+def seeded(session, trgm):
+    seed_users(session, 20000)
+    seed_roles(session, 2000)
+    session.execute(
+        text(
+            "INSERT INTO permissions (name, description, color) "
+            "SELECT 'perm' || g, 'Permission ' || g, '#ffffff' "
+            "FROM generate_series(1, 2000) g"
+        )
+    )
+    analyze(session)
+
+
+@pytest.fixture
+def search_plan(explain):
+    """EXPLAIN the page a table draws for a global search."""
+    from app.utils.datatables import like_pattern
+
+    def search_plan(table, search: str) -> str:
+        plan = table.parse(MultiDict({"search[value]": search}))
+        stmt = table.statement(plan).params(
+            search=like_pattern(search), offset=plan.start, limit=plan.length
+        )
+        return explain(stmt)
+
+    return search_plan
+
+
+@pytest.mark.parametrize("table", ["users_table", "role_users_table"])
+def test_user_search_uses_trigram_indexes(seeded, search_plan, table):
+    from app.views.admin import tables
+
+    plan = search_plan(getattr(tables, table), "user1234")
+    assert "Bitmap Index Scan on ix_users_username_trgm" in plan
+    assert "Bitmap Index Scan on ix_users_email_trgm" in plan
+    assert "Seq Scan on users" not in plan
+
+
+def test_role_search_uses_trigram_index(seeded, search_plan):
+    from app.views.admin.tables import roles_table
+
+    plan = search_plan(roles_table, "role1234")
+    assert "Bitmap Index Scan on ix_roles_name_trgm" in plan
+    assert "Seq Scan on roles" not in plan
+
+
+def test_permission_search_uses_trigram_index(seeded, search_plan):
+    from app.views.admin.tables import permissions_table
+
+    plan = search_plan(permissions_table, "perm1234")
+    assert "Bitmap Index Scan on ix_permissions_name_trgm" in plan
+    assert "Seq Scan on permissions" not in plan